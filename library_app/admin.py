@@ -1,5 +1,11 @@
+from django import forms
 from django.contrib import admin
-from .models import Book, UserProfile, BorrowRecord
+from django.db import transaction
+from .models import (
+    OPEN_STATUSES, Book, BorrowRecordArchive, DailyLoanRollup, Hold, LibraryEvent, LoanNotice, UserProfile, BorrowRecord,
+)
+from . import events, stats
+from .services import release_copies, take_copy
 
 # Register your models here.
 
@@ -13,11 +19,121 @@ class BookAdmin(admin.ModelAdmin):
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'library_card_number', 'is_librarian', 'membership_date')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
     search_fields = ('user__username', 'library_card_number')
 
 
+class BorrowRecordAdminForm(forms.ModelForm):
+    class Meta:
+        model = BorrowRecord
+        fields = '__all__'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        book = cleaned_data.get('book')
+        was_open = not self.instance._state.adding and self.initial.get('status') in OPEN_STATUSES
+        if (book is not None and not was_open
+                and cleaned_data.get('status') in OPEN_STATUSES and not book.is_available()):
+            raise forms.ValidationError('No copies of this book are available.')
+        return cleaned_data
+
+
 @admin.register(BorrowRecord)
 class BorrowRecordAdmin(admin.ModelAdmin):
+    form = BorrowRecordAdminForm
     list_display = ('user', 'book', 'borrow_date', 'due_date', 'status')
+    list_select_related = ('user', 'book')
+    # Select widgets would load every user and book into the change form.
+    raw_id_fields = ('user', 'book')
+    search_fields = ('user__username', 'book__title')
+    list_filter = ('status', 'borrow_date')
+
+    def save_model(self, request, obj, form, change):
+        # Keep inventory and counters in step with loans opened or closed here.
+        old_status = form.initial.get('status') if change else None
+        was_open = old_status in OPEN_STATUSES
+        is_open = obj.status in OPEN_STATUSES
+        with transaction.atomic():
+            if is_open and not was_open:
+                take_copy(obj.book_id)
+            elif was_open and not is_open:
+                release_copies(obj.book_id)
+            stats.adjust(
+                total_borrowed=int(is_open) - int(was_open),
+                total_overdue=int(obj.status == 'overdue') - int(old_status == 'overdue'),
+            )
+            super().save_model(request, obj, form, change)
+            if is_open != was_open:
+                events.emit('borrowed' if is_open else 'returned',
+                            user_id=obj.user_id, book_id=obj.book_id, loan_id=obj.pk)
+
+
+@admin.register(BorrowRecordArchive)
+class BorrowRecordArchiveAdmin(admin.ModelAdmin):
+    list_display = ('user', 'book', 'borrow_date', 'return_date', 'archived_at')
+    list_select_related = ('user', 'book')
+    raw_id_fields = ('user', 'book')
+    search_fields = ('user__username', 'book__title')
+    date_hierarchy = 'borrow_date'
+
+    # History is written by archive_loans only.
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Hold)
+class HoldAdmin(admin.ModelAdmin):
+    list_display = ('user', 'book', 'status', 'created_at', 'expires_at')
+    list_select_related = ('user', 'book')
+    raw_id_fields = ('user', 'book')
+    # Status changes go through library_app.services so copies follow them.
+    readonly_fields = ('status', 'ready_at', 'expires_at')
     search_fields = ('user__username', 'book__title')
-    list_filter = ('status', 'borrow_date')
\ No newline at end of file
+    list_filter = ('status',)
+
+
+@admin.register(LoanNotice)
+class LoanNoticeAdmin(admin.ModelAdmin):
+    list_display = ('user', 'loan', 'kind', 'due_date', 'sent_at')
+    list_select_related = ('user',)
+    raw_id_fields = ('user', 'loan')
+    search_fields = ('user__username', 'user__email')
+    list_filter = ('kind',)
+    date_hierarchy = 'sent_at'
+
+    # Written by send_reminders only.
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(LibraryEvent)
+class LibraryEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'user', 'book', 'loan_id', 'created_at')
+    list_select_related = ('user', 'book')
+    raw_id_fields = ('user', 'book')
+    list_filter = ('kind',)
+    date_hierarchy = 'created_at'
+
+    # The outbox is append-only; consumers rely on it never changing.
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DailyLoanRollup)
+class DailyLoanRollupAdmin(admin.ModelAdmin):
+    list_display = ('day', 'category', 'borrowed', 'returned', 'overdue')
+    list_filter = ('category',)
+    date_hierarchy = 'day'
\ No newline at end of file
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class BooksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'library_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import metrics, querybudget
+
+        connection_created.connect(querybudget.install)
+        querybudget.install_all()
+        connection_created.connect(metrics.count_connection)
+        metrics.register_collector(metrics.database_lines)
@@ -0,0 +1,113 @@
+"""
+Static asset pipeline.
+
+Third-party files are pinned in VENDOR.  ``manage.py vendor_assets``
+downloads them into static/vendor/ once, checking each against its
+Subresource Integrity hash, and after that ``collectstatic`` needs no
+network.  Until they are vendored, pages load them from the CDN instead
+(see templatetags/assets.py).
+
+``collectstatic`` then goes through CompressedManifestStaticFilesStorage:
+CSS is minified, every file gets a content-hashed name, and text files get
+.gz (and, with the brotli package installed, .br) siblings.
+views.static_asset serves those with far-future cache headers, so a
+repeat page load fetches no assets at all.
+"""
+import gzip
+import os
+import re
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+
+# name: (CDN URL, path under static/, SRI hash of the CDN file)
+VENDOR = {
+    'bootstrap.css': (
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css',
+        'vendor/bootstrap/bootstrap.min.css',
+        'sha384-1BmE4kWBq78iYhFldvKuhfTAU6auU8tT94WrHftjDbrCEXSU1oBoqyl2QvZ6jIW3',
+    ),
+    'bootstrap.js': (
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js',
+        'vendor/bootstrap/bootstrap.bundle.min.js',
+        'sha384-ka7Sk0Gln4gmtz2MlQnikT1wXgYsOg+OMhuP+IlRH9sENBO0LRn5q+8nbTov4+1p',
+    ),
+}
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.ico', '.json', '.txt', '.map', '.html')
+
+# (suffix, Content-Encoding), best first; views.static_asset sends the first
+# one the client accepts.
+ENCODINGS = (('.br', 'br'), ('.gz', 'gzip'))
+
+# Names written by ManifestStaticFilesStorage: name.<12 hex digits>.ext
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_CSS_SPACE = re.compile(r'\s+')
+_CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+
+
+def minify_css(css):
+    """Drop comments and needless whitespace; conservative, never rewrites values."""
+    css = _CSS_COMMENT.sub('', css)
+    css = _CSS_SPACE.sub(' ', css)
+    css = _CSS_PUNCTUATION.sub(r'\1', css)
+    return css.replace(';}', '}').strip() + '\n'
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # A template naming a file collectstatic has not seen gets its plain
+    # URL instead of a 500, so development and tests work without a build.
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Not in STATIC_ROOT either, so there is nothing to hash.
+            return name
+
+    def _save(self, name, content):
+        if name.endswith('.css') and not name.endswith('.min.css'):
+            content.seek(0)  # hashing may have read it already
+            content = ContentFile(minify_css(content.read().decode()).encode())
+        return super()._save(name, content)
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed_names = []
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names.append(hashed_name)
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for hashed_name in dict.fromkeys(hashed_names):
+            if hashed_name.endswith(COMPRESSIBLE):
+                self.compress(hashed_name)
+
+    def compress(self, name):
+        """Write name.gz and name.br where they are smaller than name."""
+        with self.open(name) as original:
+            data = original.read()
+        brotli = _brotli()
+        compressors = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            compressors.append(('.br', lambda data: brotli.compress(data, quality=11)))
+        for suffix, compress in compressors:
+            compressed = compress(data)
+            if len(compressed) < len(data):
+                path = self.path(name + suffix)
+                with open(path, 'wb') as output:
+                    output.write(compressed)
+            elif self.exists(name + suffix):
+                os.remove(self.path(name + suffix))
@@ -0,0 +1,90 @@
+"""
+Authentication backend that caches each member's User and UserProfile.
+
+AuthenticationMiddleware looks the user up on every request and most pages
+then read user.userprofile.  CachedModelBackend loads both in one query,
+keeps them in the cache for LIBRARY_USER_CACHE_TIMEOUT seconds and serves
+later requests from there.  Saving or deleting a User or UserProfile
+(password changes, logins, profile edits) drops the entry (see signals.py);
+bulk updates that skip save() are only picked up when it expires.
+
+The password hash is never cached.  The entry carries the session auth
+hashes derived from it instead, which is all that checking a session
+needs; the cached User has password deferred, so anything that does read
+it (check_password) loads it from the database, and save() leaves it alone.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+UserModel = get_user_model()
+
+
+def _user_key(user_id):
+    # 'member', not the 'user' of entries that held the whole User.
+    return 'auth:member:%s' % user_id
+
+
+def invalidate_user(user_id):
+    """Drop a cached user once the current transaction commits."""
+    transaction.on_commit(lambda: cache.delete(_user_key(user_id)))
+
+
+def _load(user_id):
+    return UserModel._default_manager.select_related('userprofile').filter(pk=user_id)
+
+
+def _entry(user):
+    """The cache entry for user: it without its password hash, and its session hashes."""
+    hashes = (user.get_session_auth_hash(), list(user.get_session_auth_fallback_hash()))
+    del user.__dict__['password']
+    return user, hashes
+
+
+def _restore(entry):
+    """The User from a cache entry, answering session hash checks from it."""
+    user, (session_hash, fallback_hashes) = entry
+
+    # Once the password is loaded or changed (set_password), the stored
+    # hashes are stale and the model's own methods take over.
+    def get_session_auth_hash():
+        if 'password' in user.__dict__:
+            return UserModel.get_session_auth_hash(user)
+        return session_hash
+
+    def get_session_auth_fallback_hash():
+        if 'password' in user.__dict__:
+            return UserModel.get_session_auth_fallback_hash(user)
+        return iter(fallback_hashes)
+
+    user.get_session_auth_hash = get_session_auth_hash
+    user.get_session_auth_fallback_hash = get_session_auth_fallback_hash
+    return user
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        key = _user_key(user_id)
+        entry = cache.get(key)
+        if entry is None:
+            user = _load(user_id).first()
+            if user is None:
+                return None
+            entry = _entry(user)
+            cache.set(key, entry, settings.LIBRARY_USER_CACHE_TIMEOUT)
+        user = _restore(entry)
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        key = _user_key(user_id)
+        entry = await cache.aget(key)
+        if entry is None:
+            user = await _load(user_id).afirst()
+            if user is None:
+                return None
+            entry = _entry(user)
+            await cache.aset(key, entry, settings.LIBRARY_USER_CACHE_TIMEOUT)
+        user = _restore(entry)
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,167 @@
+"""
+Response caching for anonymous catalog pages.
+
+Every cached page is tagged with one or more invalidation scopes (the whole
+catalog, a single book, the homepage statistics).  Each scope has a
+generation token stored in the cache and embedded in the page keys, so
+invalidating a scope is a single cache write: pages built from the old token
+are simply never looked up again and age out on their own.  This works the
+same on locmem, file-based and shared (Redis/Memcached) backends.
+
+Template fragments shared by many pages, such as book cards, are cached by
+arender_fragments() under keys that carry their own version instead.
+"""
+import functools
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+
+CATALOG = 'catalog'
+STATS = 'stats'
+
+
+def book_scope(book_id):
+    return 'book:%s' % book_id
+
+
+def _generation_key(scope):
+    return 'gen:%s' % scope
+
+
+def get_generations(scopes):
+    """Current token for each scope, creating tokens that are missing."""
+    keys = [_generation_key(scope) for scope in scopes]
+    tokens = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in tokens}
+    if missing:
+        cache.set_many(missing, None)
+        tokens.update(missing)
+    return [str(tokens[key]) for key in keys]
+
+
+async def aget_generations(scopes):
+    keys = [_generation_key(scope) for scope in scopes]
+    tokens = await cache.aget_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in tokens}
+    if missing:
+        await cache.aset_many(missing, None)
+        tokens.update(missing)
+    return [str(tokens[key]) for key in keys]
+
+
+def bump(*scopes):
+    """Invalidate every page tagged with any of scopes."""
+    now = time.time_ns()
+    cache.set_many({_generation_key(scope): now for scope in scopes}, None)
+
+
+def invalidate(*scopes):
+    """bump() once the current transaction commits (immediately outside one)."""
+    transaction.on_commit(lambda: bump(*scopes))
+
+
+def invalidate_book(book_id):
+    """A catalog edit: the book's own pages and every listing."""
+    invalidate(CATALOG, book_scope(book_id))
+
+
+def invalidate_availability(book_id):
+    """
+    A borrow or return: only the book's own pages.
+
+    Listings show copy counts through the book cards, whose fragment keys
+    carry updated_at, so they need no flush.
+    """
+    invalidate(book_scope(book_id))
+
+
+def _page_key(request, view_name, generations):
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    digest = hashlib.md5(f'{request.path}?{query}'.encode()).hexdigest()
+    return 'page:%s:%s:%s' % (view_name, '.'.join(generations), digest)
+
+
+def page_key(request, view_name, scopes):
+    return _page_key(request, view_name, get_generations(scopes))
+
+
+async def apage_key(request, view_name, scopes):
+    return _page_key(request, view_name, await aget_generations(scopes))
+
+
+def _fragment_key(template_name, parts):
+    return 'fragment:%s:%s' % (template_name, ':'.join(str(part) for part in parts))
+
+
+async def arender_fragments(template_name, fragments):
+    """
+    Render template_name once per (key parts, context) in fragments, reusing
+    cached renders; returns the HTML in order.
+
+    The key parts must change whenever the output would (e.g. a row's id
+    and updated_at), since fragments are never invalidated, only replaced.
+    One cache round trip reads them all and one stores the misses.
+    """
+    keys = [_fragment_key(template_name, parts) for parts, _ in fragments]
+    # Backends without native async (locmem, Redis) implement aget_many()
+    # as one thread hop and one round trip per key; get_many() is one MGET.
+    cached = await sync_to_async(cache.get_many)(keys)
+    missing = {}
+    html = []
+    template = get_template(template_name)
+    for key, (_, context) in zip(keys, fragments):
+        if key not in cached:
+            cached[key] = missing[key] = template.render(context)
+        html.append(mark_safe(cached[key]))
+    if missing:
+        await sync_to_async(cache.set_many)(missing, settings.LIBRARY_FRAGMENT_CACHE_TIMEOUT)
+    return html
+
+
+def cache_anonymous_page(get_scopes):
+    """
+    Cache a view's response for anonymous GET/HEAD requests.
+
+    get_scopes is called with the view's arguments and returns the scopes the
+    page depends on.  Responses that set cookies or aren't 200s are not
+    stored, and logged-in users always get a freshly rendered page.  Works
+    on sync and async views alike.
+    """
+    def decorator(view_func):
+        view_name = view_func.__qualname__
+
+        if iscoroutinefunction(view_func):
+            async def wrapper(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD') or (await request.auser()).is_authenticated:
+                    return await view_func(request, *args, **kwargs)
+                key = await apage_key(request, view_name, get_scopes(request, *args, **kwargs))
+                response = await cache.aget(key)
+                if response is None:
+                    response = await view_func(request, *args, **kwargs)
+                    if response.status_code == 200 and not response.cookies:
+                        await cache.aset(key, response, settings.LIBRARY_PAGE_CACHE_TIMEOUT)
+                return response
+            markcoroutinefunction(wrapper)
+        else:
+            def wrapper(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+                    return view_func(request, *args, **kwargs)
+                key = page_key(request, view_name, get_scopes(request, *args, **kwargs))
+                response = cache.get(key)
+                if response is None:
+                    response = view_func(request, *args, **kwargs)
+                    if response.status_code == 200 and not response.cookies:
+                        cache.set(key, response, settings.LIBRARY_PAGE_CACHE_TIMEOUT)
+                return response
+
+        wrapper = functools.wraps(view_func)(wrapper)
+        return wrapper
+    return decorator
@@ -0,0 +1,88 @@
+"""
+Activity outbox.
+
+Borrows, returns, new books and new members each append a LibraryEvent in
+the same transaction as the change itself (services, signals and
+import_books call emit()), so the log holds exactly the changes that were
+committed.  Derived data can follow it instead of rescanning the loan and
+catalog tables: ``manage.py consume_events`` hands the events, in id order
+and in batches, to every function registered with @consumer, and keeps how
+far each one has got in a JobCheckpoint.
+
+Ids are handed out when a transaction inserts, not when it commits, so a
+higher id can become visible before a lower one.  A consumer therefore stops
+at a gap in the ids until the event after it is LIBRARY_EVENT_SETTLE_SECONDS
+old; a gap that old is taken to be a rolled-back transaction (or a skipped
+sequence value) and passed over.  Keep transactions that emit events well
+below that.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import JobCheckpoint, LibraryEvent
+from .reports import rollup_day
+
+
+CONSUMERS = {}
+
+
+def consumer(name):
+    """Register the decorated function(events) as the consumer called name."""
+    def register(handler):
+        CONSUMERS[name] = handler
+        return handler
+    return register
+
+
+def emit(kind, **refs):
+    """Append one event, e.g. ``emit('returned', user_id=1, book_id=2, loan_id=3)``."""
+    return LibraryEvent.objects.create(kind=kind, **refs)
+
+
+def settled(events, position, now=None):
+    """The leading run of events that no in-flight transaction can still precede."""
+    horizon = (now or timezone.now()) - timedelta(seconds=settings.LIBRARY_EVENT_SETTLE_SECONDS)
+    expected = position + 1
+    for index, event in enumerate(events):
+        if event.pk != expected and event.created_at > horizon:
+            return events[:index]
+        expected = event.pk + 1
+    return events
+
+
+def consume(name, batch_size=1000, now=None):
+    """
+    Feed the named consumer every settled event it has not seen yet.
+
+    A generator yielding how many events each batch held.  A batch is
+    handled and the checkpoint moved past it in one transaction, so
+    database changes the consumer makes are applied exactly once; the
+    checkpoint row stays locked meanwhile, so two workers for the same
+    consumer take turns rather than doubling up.
+    """
+    handler = CONSUMERS[name]
+    while True:
+        with transaction.atomic():
+            checkpoint, _ = JobCheckpoint.objects.select_for_update().get_or_create(name=f'events:{name}')
+            events = settled(
+                list(LibraryEvent.objects.filter(pk__gt=checkpoint.position).order_by('pk')[:batch_size]),
+                checkpoint.position,
+                now,
+            )
+            if not events:
+                return
+            handler(events)
+            checkpoint.position = events[-1].pk
+            checkpoint.save(update_fields=['position', 'updated_at'])
+        yield len(events)
+
+
+@consumer('rollups')
+def refresh_rollups(events):
+    """Recompute the daily loan rollups of the days that saw borrows or returns."""
+    days = {timezone.localdate(event.created_at) for event in events if event.kind in ('borrowed', 'returned')}
+    for day in sorted(days):
+        rollup_day(day)
@@ -0,0 +1,136 @@
+"""
+Streaming CSV and JSON Lines exports of the catalog, loans and members.
+
+Rows are read with values_list() and iterator(chunk_size=...) (a
+server-side cursor on PostgreSQL), formatted a chunk at a time and handed
+on, so memory stays flat however many rows there are.  Both the export
+view and ``manage.py export`` use this module.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime, time, timedelta
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import Book, BorrowRecord, BorrowRecordArchive, UserProfile
+
+
+CHUNK_SIZE = 2000
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+LOAN_FIELDS = (
+    'id', 'user__username', 'book_id', 'book__isbn', 'book__title',
+    'borrow_date', 'due_date', 'return_date', 'status',
+)
+
+# dataset: (model, exported fields)
+DATASETS = {
+    'books': (Book, (
+        'id', 'isbn', 'title', 'author', 'category', 'publication_date', 'pages',
+        'total_copies', 'available_copies', 'created_at',
+    )),
+    'loans': (BorrowRecord, LOAN_FIELDS),
+    'members': (UserProfile, (
+        'user_id', 'user__username', 'user__email', 'library_card_number',
+        'phone_number', 'membership_date', 'is_librarian',
+    )),
+}
+
+STATUSES = {value for value, _ in BorrowRecord.STATUS_CHOICES}
+
+
+def _date(value, name):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{name} is not a YYYY-MM-DD date: {value!r}')
+
+
+def loan_filters(status=None, borrowed_from=None, borrowed_to=None):
+    """
+    Filter kwargs for loans, as in the BorrowRecord admin: a status and an
+    inclusive borrow date range (YYYY-MM-DD strings).  Raises ValueError.
+    """
+    filters = {}
+    if status:
+        if status not in STATUSES:
+            raise ValueError(f'unknown status: {status!r}')
+        filters['status'] = status
+    if borrowed_from:
+        day = _date(borrowed_from, 'borrowed_from')
+        filters['borrow_date__gte'] = timezone.make_aware(datetime.combine(day, time.min))
+    if borrowed_to:
+        day = _date(borrowed_to, 'borrowed_to') + timedelta(days=1)
+        filters['borrow_date__lt'] = timezone.make_aware(datetime.combine(day, time.min))
+    return filters
+
+
+def rows(dataset, filters=None, archived=False):
+    """(header, queryset of value tuples) for a dataset; filters apply to loans."""
+    model, fields = DATASETS[dataset]
+    queryset = model.objects.all()
+    if dataset == 'loans':
+        queryset = queryset.filter(**(filters or {}))
+        if archived:
+            # Archived loans keep their ids, so the union is still id-ordered.
+            archive = BorrowRecordArchive.objects.filter(**(filters or {}))
+            return fields, (
+                queryset.order_by().values_list(*fields)
+                .union(archive.order_by().values_list(*fields), all=True)
+                .order_by('id')
+            )
+    return fields, queryset.values_list(*fields).order_by(model._meta.pk.attname)
+
+
+def _formatter(fmt, header):
+    """(header text, function turning a list of rows into text)."""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def render(chunk):
+            writer.writerows(chunk)
+            text = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return text
+
+        return render([header]), render
+
+    def render(chunk):
+        return ''.join(
+            json.dumps(dict(zip(header, row)), cls=DjangoJSONEncoder) + '\n' for row in chunk
+        )
+
+    return '', render
+
+
+def stream(fmt, header, queryset):
+    """Yield the export as text, one chunk of rows at a time."""
+    head, render = _formatter(fmt, header)
+    if head:
+        yield head
+    chunk = []
+    for row in queryset.iterator(chunk_size=CHUNK_SIZE):
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            yield render(chunk)
+            chunk = []
+    if chunk:
+        yield render(chunk)
+
+
+async def astream(fmt, header, queryset):
+    """
+    stream() for ASGI, which would otherwise read a sync iterator whole.
+
+    Chunks are pulled in the database thread: values_list() querysets cannot
+    use aiterator() as it runs their query in the event loop.
+    """
+    chunks = stream(fmt, header, queryset)
+    next_chunk = sync_to_async(next)
+    while (text := await next_chunk(chunks, None)) is not None:
+        yield text
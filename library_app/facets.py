@@ -0,0 +1,111 @@
+"""
+Facet counts for catalog browsing: books per category, per availability and
+per publication decade.
+
+All three come from one grouped query over the current search, cross-tabbed
+by category, availability and publication year and served from the
+book_facet_idx covering index.  Each facet's counts are then tallied in
+Python with the *other* selected facets applied, so choosing a category
+still shows how many books the alternatives hold.  The cross-tab is cached
+per search under the catalog generation, which catalog edits bump, so
+repeat views cost no query at all.  Borrows and returns do not bump it, so
+the availability counts can lag them by up to LIBRARY_PAGE_CACHE_TIMEOUT.
+"""
+import hashlib
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import BooleanField, Count, ExpressionWrapper, Q
+from django.db.models.functions import ExtractYear
+
+from .cache import CATALOG, aget_generations
+from .models import Book
+from .search import search_books
+
+
+FACETS = ('category', 'available', 'decade')
+
+
+def selected_facets(params):
+    """The facet values chosen in a query dict; None where nothing (valid) is."""
+    categories = dict(Book.CATEGORY_CHOICES)
+    available = {'1': True, '0': False}.get(params.get('available', ''))
+    try:
+        decade = int(params.get('decade', ''))
+    except ValueError:
+        decade = None
+    return {
+        'category': params.get('category') if params.get('category') in categories else None,
+        'available': available,
+        'decade': decade - decade % 10 if decade is not None and 0 < decade < 10000 else None,
+    }
+
+
+def narrow(books, selected):
+    """Filter a Book queryset down to the selected facets."""
+    if selected['category'] is not None:
+        books = books.filter(category=selected['category'])
+    if selected['available'] is True:
+        books = books.filter(available_copies__gt=0)
+    elif selected['available'] is False:
+        books = books.filter(available_copies__lte=0)
+    if selected['decade'] is not None:
+        books = books.filter(
+            publication_date__gte=date(selected['decade'], 1, 1),
+            publication_date__lt=date(selected['decade'] + 10, 1, 1),
+        )
+    return books
+
+
+def _cross_tab(search_query):
+    # Grouped by year rather than decade: no backend-specific arithmetic,
+    # and still only a few thousand rows at most.
+    return (
+        search_books(Book.objects.order_by(), search_query)
+        .values_list(
+            'category',
+            ExpressionWrapper(Q(available_copies__gt=0), output_field=BooleanField()),
+            ExtractYear('publication_date'),
+        )
+        .annotate(books=Count('id'))
+    )
+
+
+async def across_search(search_query):
+    """[(category, available, year, books), ...] for a search, cached."""
+    generation, = await aget_generations([CATALOG])
+    digest = hashlib.md5(search_query.strip().encode()).hexdigest()
+    key = 'facets:%s:%s' % (generation, digest)
+    rows = await cache.aget(key)
+    if rows is None:
+        rows = [tuple(row) async for row in _cross_tab(search_query)]
+        await cache.aset(key, rows, settings.LIBRARY_PAGE_CACHE_TIMEOUT)
+    return rows
+
+
+def tally(rows, selected):
+    """
+    Facet options for the template: {facet: [(value, label, count), ...]}.
+
+    Every category is always listed; decades only where there are books.
+    """
+    counts = {facet: {} for facet in FACETS}
+    for category, available, year, books in rows:
+        row = {'category': category, 'available': bool(available), 'decade': year - year % 10}
+        for facet in FACETS:
+            if all(selected[other] in (None, row[other]) for other in FACETS if other != facet):
+                counts[facet][row[facet]] = counts[facet].get(row[facet], 0) + books
+    return {
+        'category': [
+            (value, label, counts['category'].get(value, 0)) for value, label in Book.CATEGORY_CHOICES
+        ],
+        'available': [
+            ('1', 'Available now', counts['available'].get(True, 0)),
+            ('0', 'All copies out', counts['available'].get(False, 0)),
+        ],
+        'decade': [
+            (str(decade), '%ds' % decade, books)
+            for decade, books in sorted(counts['decade'].items(), reverse=True)
+        ],
+    }
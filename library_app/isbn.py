@@ -0,0 +1,32 @@
+"""ISBN validation and normalisation to the 13-digit form stored on Book."""
+import re
+
+
+def _isbn10_valid(digits):
+    total = sum((10 - i) * (10 if c == 'X' else int(c)) for i, c in enumerate(digits))
+    return total % 11 == 0
+
+
+def _isbn13_check_digit(first12):
+    total = sum(int(c) * (3 if i % 2 else 1) for i, c in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+
+def normalize_isbn(value):
+    """
+    Return value as a validated ISBN-13 string.
+
+    Accepts ISBN-10 or ISBN-13 with optional spaces/hyphens; raises
+    ValueError if the format or check digit is wrong.
+    """
+    digits = re.sub(r'[\s-]', '', str(value)).upper()
+    if re.fullmatch(r'\d{9}[\dX]', digits):
+        if not _isbn10_valid(digits):
+            raise ValueError(f'bad ISBN-10 check digit: {value!r}')
+        first12 = '978' + digits[:9]
+        return first12 + _isbn13_check_digit(first12)
+    if re.fullmatch(r'\d{13}', digits):
+        if _isbn13_check_digit(digits[:12]) != digits[12]:
+            raise ValueError(f'bad ISBN-13 check digit: {value!r}')
+        return digits
+    raise ValueError(f'not an ISBN: {value!r}')
@@ -0,0 +1,41 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from library_app.services import archive_loans
+
+
+class Command(BaseCommand):
+    help = (
+        "Move loans returned more than --older-than days ago from BorrowRecord "
+        "into BorrowRecordArchive, in chunks that each commit on their own. "
+        "Safe to interrupt and re-run; it picks up where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=settings.LIBRARY_ARCHIVE_AFTER_DAYS,
+                            help='Archive loans returned more than this many days ago.')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive.')
+        if options['older_than'] < 1:
+            raise CommandError('--older-than must be positive.')
+        cutoff = timezone.localdate() - timedelta(days=options['older_than'])
+        moved = 0
+        started = time.monotonic()
+        try:
+            for count in archive_loans(cutoff, chunk_size=options['chunk_size']):
+                moved += count
+                if options['verbosity'] >= 2:
+                    self.stdout.write(f'{moved} loans archived')
+        except KeyboardInterrupt:
+            self.stdout.write(f'Interrupted after archiving {moved} loans; run again to continue.')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {moved} loans returned before {cutoff} in {time.monotonic() - started:.1f}s.'
+        ))
@@ -0,0 +1,333 @@
+import http.cookiejar
+import json
+import random
+import re
+import statistics
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from library_app.models import Book, BorrowRecord
+
+from .seed_library import DEFAULT_PASSWORD, USERNAME_PREFIX, WORDS
+
+
+METRIC_LINE = re.compile(r'^library_request_sql_queries_(sum|count)\{view="([^"]*)"\} (\S+)$', re.M)
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    # A redirect is the response being measured, not something to follow.
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Client:
+    """One simulated browser: its own cookie jar, so its own session."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), NoRedirect,
+        )
+
+    def request(self, path, data=None, headers=None):
+        """Return (status, seconds, body); status 0 means the request failed."""
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers or {})
+        started = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=30) as response:
+                content, status = response.read(), response.status
+        except urllib.error.HTTPError as exc:
+            content, status = exc.read(), exc.code
+        except OSError:
+            content, status = b'', 0
+        return status, time.perf_counter() - started, content
+
+    def post(self, path, data=None):
+        """request() as a form POST carrying the session's CSRF token."""
+        token = next((c.value for c in self.cookies if c.name == 'csrftoken'), '')
+        return self.request(
+            path, {**(data or {}), 'csrfmiddlewaretoken': token}, headers={'Referer': self.base_url + path},
+        )
+
+    def login(self, username, password):
+        self.request('/login/')
+        status, _, _ = self.post('/login/', {'username': username, 'password': password})
+        if status != 302:
+            raise CommandError(f'Could not log in as {username} (HTTP {status}); run seed_library first?')
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+# Each scenario makes one or more requests per iteration and returns them as
+# (label, status, seconds) triples.
+
+def scenario_index(client, rng, data):
+    status, seconds, _ = client.request('/')
+    return [('index', status, seconds)]
+
+
+def scenario_search(client, rng, data):
+    query = urllib.parse.urlencode({'search': ' '.join(rng.sample(WORDS, 2))})
+    status, seconds, _ = client.request('/books/?' + query)
+    return [('book_list', status, seconds)]
+
+
+def scenario_borrow_return(client, rng, data):
+    book_id = rng.choice(data['book_ids'])
+    status, seconds, _ = client.post(f'/borrow/{book_id}/')
+    samples = [('borrow_book', status, seconds)]
+    # Found from the database rather than the page: only the HTTP calls are timed.
+    record_id = (
+        BorrowRecord.objects
+        .filter(user_id=client.user_id, book_id=book_id, status='borrowed')
+        .order_by('-id').values_list('id', flat=True).first()
+    )
+    if record_id:
+        status, seconds, _ = client.post(f'/return/{record_id}/')
+        samples.append(('return_book', status, seconds))
+    return samples
+
+
+def scenario_dashboard(client, rng, data):
+    status, seconds, _ = client.request('/dashboard/')
+    return [('dashboard', status, seconds)]
+
+
+def scenario_librarian(client, rng, data):
+    status, seconds, _ = client.request('/librarian/')
+    return [('librarian_dashboard', status, seconds)]
+
+
+# name: (function, who logs in: None, 'member' or 'librarian')
+SCENARIOS = {
+    'index': (scenario_index, None),
+    'search': (scenario_search, None),
+    'borrow_return': (scenario_borrow_return, 'member'),
+    'dashboard': (scenario_dashboard, 'member'),
+    'librarian': (scenario_librarian, 'librarian'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive a running server (`manage.py runserver --noreload`, or uvicorn "
+        "for the ASGI path) with concurrent clients and report latency "
+        "percentiles, throughput and SQL queries per request. Uses the members created by seed_library; query "
+        "counts are read from /metrics/ and need METRICS_TOKEN set on both sides."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                            help='Scenario to run; repeatable (default: all).')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per scenario.')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed iterations per client first.')
+        parser.add_argument('--password', default=DEFAULT_PASSWORD)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--compare', help='A previous --output file to print the change against.')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be positive.')
+        self.base_url = options['url'].rstrip('/')
+        self.options = options
+        status, _, _ = Client(self.base_url).request('/')
+        if status == 0:
+            raise CommandError(f'No server answering at {self.base_url}.')
+
+        data = {
+            'book_ids': list(
+                Book.objects.filter(available_copies__gt=0).order_by('?')
+                .values_list('id', flat=True)[:1000]
+            ),
+        }
+        results = {
+            'meta': {
+                'started': datetime.now(timezone.utc).isoformat(),
+                'commit': self.git_commit(),
+                'url': self.base_url,
+                'database': connection.vendor,
+                'books': Book.objects.count(),
+                'loans': BorrowRecord.objects.count(),
+                'concurrency': options['concurrency'],
+                'duration': options['duration'],
+            },
+            'scenarios': {},
+        }
+        for name in options['scenario'] or list(SCENARIOS):
+            results['scenarios'][name] = summary = self.run_scenario(name, data)
+            self.report(name, summary)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}.")
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def clients(self, login_as):
+        concurrency = self.options['concurrency']
+        if login_as is None:
+            return [Client(self.base_url) for _ in range(concurrency)]
+        if login_as == 'librarian':
+            users = list(User.objects.filter(userprofile__is_librarian=True, is_active=True)
+                         .values_list('id', 'username')[:1]) * concurrency
+        else:
+            # Seeded members other than the librarian, one per client.
+            users = list(User.objects.filter(username__startswith=USERNAME_PREFIX,
+                                             userprofile__is_librarian=False)
+                         .order_by('id').values_list('id', 'username')[:concurrency])
+        if len(users) < concurrency:
+            raise CommandError(f'Need {concurrency} seeded {login_as} accounts; run seed_library first.')
+        clients = []
+        for user_id, username in users:
+            client = Client(self.base_url)
+            client.login(username, self.options['password'])
+            client.user_id = user_id
+            clients.append(client)
+        return clients
+
+    def run_scenario(self, name, data):
+        function, login_as = SCENARIOS[name]
+        clients = self.clients(login_as)
+        for index, client in enumerate(clients):
+            rng = random.Random(self.options['seed'] + index)
+            for _ in range(self.options['warmup']):
+                function(client, rng, data)
+
+        samples = []
+        lock = threading.Lock()
+        before = self.scrape_queries()
+        deadline = time.monotonic() + self.options['duration']
+
+        def worker(client, rng):
+            local = []
+            while time.monotonic() < deadline:
+                local.extend(function(client, rng, data))
+            with lock:
+                samples.extend(local)
+
+        threads = [
+            threading.Thread(target=worker, args=(client, random.Random(self.options['seed'] + index)))
+            for index, client in enumerate(clients)
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        after = self.scrape_queries()
+        return self.summarize(samples, elapsed, before, after)
+
+    def summarize(self, samples, elapsed, before, after):
+        requests = {}
+        for label, status, seconds in samples:
+            requests.setdefault(label, []).append((status, seconds))
+        summary = {}
+        for label, rows in requests.items():
+            latencies = sorted(seconds * 1000 for _, seconds in rows)
+            statuses = {}
+            for status, _ in rows:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            view = f'library_app.views.{label}'
+            queries = None
+            if before is not None and after is not None and view in after:
+                total, count = after[view]
+                old_total, old_count = before.get(view, (0.0, 0))
+                if count > old_count:
+                    queries = round((total - old_total) / (count - old_count), 2)
+            summary[label] = {
+                'requests': len(rows),
+                'errors': sum(1 for status, _ in rows if status == 0 or status >= 500),
+                'throughput': round(len(rows) / elapsed, 1),
+                'latency_ms': {
+                    'mean': round(statistics.fmean(latencies), 2),
+                    'p50': round(percentile(latencies, 0.50), 2),
+                    'p95': round(percentile(latencies, 0.95), 2),
+                    'p99': round(percentile(latencies, 0.99), 2),
+                    'max': round(latencies[-1], 2),
+                },
+                'status': statuses,
+                'queries_per_request': queries,
+            }
+        return summary
+
+    def scrape_queries(self):
+        """{view: (query sum, request count)} from /metrics/, or None if unavailable."""
+        token = getattr(settings, 'METRICS_TOKEN', '')
+        if not token:
+            return None
+        status, _, body = Client(self.base_url).request('/metrics/', headers={'Authorization': f'Bearer {token}'})
+        if status != 200:
+            return None
+        metrics = {}
+        for kind, view, value in METRIC_LINE.findall(body.decode()):
+            total, count = metrics.get(view, (0.0, 0))
+            if kind == 'sum':
+                total = float(value)
+            else:
+                count = int(value)
+            metrics[view] = (total, count)
+        return metrics
+
+    def report(self, name, summary):
+        self.stdout.write(self.style.MIGRATE_HEADING(name))
+        for label, row in summary.items():
+            latency = row['latency_ms']
+            queries = row['queries_per_request']
+            self.stdout.write(
+                f"  {label:<20} {row['requests']:>6} req  {row['throughput']:>7.1f}/s  "
+                f"p50 {latency['p50']:>7.1f}ms  p95 {latency['p95']:>7.1f}ms  p99 {latency['p99']:>7.1f}ms  "
+                f"errors {row['errors']}  queries {'-' if queries is None else queries}"
+            )
+
+    def compare(self, path, results):
+        try:
+            with open(path) as previous_file:
+                previous = json.load(previous_file)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Cannot read {path}: {exc}')
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Change against {previous['meta'].get('commit') or path}"
+        ))
+        for name, summary in results['scenarios'].items():
+            for label, row in summary.items():
+                old = previous['scenarios'].get(name, {}).get(label)
+                if not old:
+                    continue
+                changes = [
+                    f"{key} {(row['latency_ms'][key] / old['latency_ms'][key] - 1) * 100:+.0f}%"
+                    for key in ('p50', 'p95', 'p99') if old['latency_ms'][key]
+                ]
+                if old['throughput']:
+                    changes.append(f"throughput {(row['throughput'] / old['throughput'] - 1) * 100:+.0f}%")
+                self.stdout.write(f"  {name}/{label}: {', '.join(changes)}")
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
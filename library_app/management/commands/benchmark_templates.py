@@ -0,0 +1,86 @@
+import statistics
+import time
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.template.engine import Engine
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+
+from library_app import facets
+from library_app.cache import _fragment_key
+from library_app.models import Book
+from library_app.views import abook_cards
+
+
+class Page(list):
+    """Enough of pagination.Page for the template: a single page."""
+    has_previous = has_next = False
+
+
+class Command(BaseCommand):
+    help = (
+        "Time rendering book_list.html for a page of --books books: template "
+        "loading with and without the cached loader, and rendering with the "
+        "book card fragments cold and cached. No server or network needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        if options['books'] < 1 or options['repeat'] < 1:
+            raise CommandError('--books and --repeat must be positive.')
+        books = Page(
+            Book.objects.defer('search_vector', 'description').order_by('-created_at', '-id')[:options['books']]
+        )
+        if not books:
+            raise CommandError('No books; run seed_library first.')
+        request = RequestFactory().get('/books/')
+        request.user = AnonymousUser()
+        selected = facets.selected_facets({})
+        facet_options = facets.tally([], selected)
+        keys = [
+            _fragment_key('book_card.html', (book.pk, book.updated_at.timestamp(), 0)) for book in books
+        ]
+
+        def render():
+            context = {
+                'books': books,
+                'cards': async_to_sync(abook_cards)(books, request),
+                'page': books,
+                'facets': facet_options,
+            }
+            return render_to_string('book_list.html', context, request)
+
+        # The rendering before cards were cached: every card inline, every time.
+        def render_uncached():
+            cache.delete_many(keys)
+            return render()
+
+        engine = Engine.get_default()
+        uncached_loader = Engine(
+            dirs=engine.dirs,
+            loaders=['django.template.loaders.filesystem.Loader', 'django.template.loaders.app_directories.Loader'],
+            libraries=engine.libraries,
+        )
+
+        results = [
+            ('load book_list.html, no cached loader', lambda: uncached_loader.get_template('book_list.html')),
+            ('load book_list.html, cached loader', lambda: engine.get_template('book_list.html')),
+            (f"render {len(books)} books, cards rendered", render_uncached),
+            (f"render {len(books)} books, cards cached", render),
+        ]
+        render()  # warm the loader and the card cache
+        for label, function in results:
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                function()
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(
+                f"{label:<45} median {statistics.median(timings):8.2f}ms  min {min(timings):8.2f}ms"
+            )
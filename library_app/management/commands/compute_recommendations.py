@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library_app import recommendations
+from library_app.routers import use_primary
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh the \"readers also borrowed\" recommendations from co-borrow "
+        "counts. By default only books affected by loans since the last run "
+        "(the books borrowed and every book sharing a borrower with them); "
+        "--full recomputes every book. Needs numpy and scipy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every book, not just affected ones.')
+        parser.add_argument('--limit', type=int, help='Recommendations kept per book (default: LIBRARY_RECOMMENDATIONS).')
+
+    def handle(self, *args, **options):
+        if options['limit'] is not None and options['limit'] < 1:
+            raise CommandError('--limit must be positive.')
+        try:
+            import numpy  # noqa: F401
+            import scipy  # noqa: F401
+        except ImportError as exc:
+            raise CommandError(f'{exc.name} is required: pip install numpy scipy')
+        started = time.monotonic()
+        # The checkpoint must not run ahead of a lagging replica.
+        with use_primary():
+            refreshed = recommendations.refresh(full=options['full'], limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed recommendations for {refreshed} book(s) in {time.monotonic() - started:.1f}s.'
+        ))
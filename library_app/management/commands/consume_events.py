@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from library_app import events
+
+
+class Command(BaseCommand):
+    help = (
+        "Feed new borrow/return/book/member events from the outbox to their "
+        "consumers, in id order and in batches, checkpointing each batch. "
+        "Idempotent; run it from cron, or with --loop as a long-running worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('consumers', nargs='*',
+                            help=f"Consumers to run (default: all of {', '.join(sorted(events.CONSUMERS))}).")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--loop', action='store_true', help='Keep running, polling every --interval seconds.')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls with --loop.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        names = options['consumers'] or sorted(events.CONSUMERS)
+        unknown = set(names) - set(events.CONSUMERS)
+        if unknown:
+            raise CommandError(f"Unknown consumer(s): {', '.join(sorted(unknown))}.")
+        try:
+            while True:
+                for name in names:
+                    started = time.monotonic()
+                    handled = sum(events.consume(name, batch_size=options['batch_size']))
+                    if handled or not options['loop']:
+                        elapsed = time.monotonic() - started
+                        self.stdout.write(
+                            f'{timezone.now():%Y-%m-%d %H:%M:%S} {name}: {handled} event(s) '
+                            f'in {elapsed:.2f}s ({handled / max(elapsed, 1e-9):.0f}/s)'
+                        )
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped.')
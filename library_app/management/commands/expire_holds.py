@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from library_app.services import expire_holds
+
+
+class Command(BaseCommand):
+    help = (
+        "Expire holds whose set-aside copy was not collected in time, passing "
+        "each copy to the next member in the queue or back to the shelf. "
+        "Works in chunks; run it from cron, or with --loop as a worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--loop', action='store_true', help='Keep running, sweeping every --interval seconds.')
+        parser.add_argument('--interval', type=float, default=300, help='Seconds between sweeps with --loop.')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive.')
+        try:
+            while True:
+                started = time.monotonic()
+                expired = expire_holds(chunk_size=options['chunk_size'])
+                self.stdout.write(
+                    f'{timezone.now():%Y-%m-%d %H:%M:%S} expired {expired} hold(s) '
+                    f'in {time.monotonic() - started:.2f}s'
+                )
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped.')
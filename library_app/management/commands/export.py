@@ -0,0 +1,49 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library_app import exports
+from library_app.routers import use_primary
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream books, loans or members to CSV or JSON Lines without loading "
+        "them into memory. Loans can be filtered like the admin: by status "
+        "and borrow date range."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(exports.DATASETS))
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--output', help='Write here instead of stdout.')
+        parser.add_argument('--status', help='Loans only: borrowed, returned or overdue.')
+        parser.add_argument('--borrowed-from', help='Loans only: borrowed on or after YYYY-MM-DD.')
+        parser.add_argument('--borrowed-to', help='Loans only: borrowed on or before YYYY-MM-DD.')
+        parser.add_argument('--archived', action='store_true', help='Loans only: include archived loans.')
+        parser.add_argument('--primary', action='store_true', help='Read from the primary, not a replica.')
+
+    def handle(self, *args, **options):
+        try:
+            filters = exports.loan_filters(options['status'], options['borrowed_from'], options['borrowed_to'])
+        except ValueError as exc:
+            raise CommandError(exc)
+        header, rows = exports.rows(options['dataset'], filters, archived=options['archived'])
+        output = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else sys.stdout
+        started = time.monotonic()
+        try:
+            if options['primary']:
+                with use_primary():
+                    self.write(output, options['format'], header, rows)
+            else:
+                self.write(output, options['format'], header, rows)
+        finally:
+            if options['output']:
+                output.close()
+        if options['output']:
+            self.stderr.write(f"Exported {options['dataset']} in {time.monotonic() - started:.1f}s.")
+
+    def write(self, output, fmt, header, rows):
+        for text in exports.stream(fmt, header, rows):
+            output.write(text)
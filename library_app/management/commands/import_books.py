@@ -0,0 +1,197 @@
+import csv
+import json
+import sys
+import time
+from datetime import date
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from library_app import cache, stats
+from library_app.isbn import normalize_isbn
+from library_app.models import Book, LibraryEvent
+
+
+CATEGORIES = {value for value, _ in Book.CATEGORY_CHOICES}
+
+# Catalog fields refreshed when an ISBN already exists.  Copy counts are only
+# set on insert: existing rows may have loans out, and overwriting
+# available_copies from a file would lose them.
+UPDATE_FIELDS = ['title', 'author', 'description', 'category', 'publication_date', 'pages', 'updated_at']
+
+
+def _int(value, field, default=None):
+    if value in (None, ''):
+        return default
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{field} is not an integer: {value!r}')
+    if number < 0:
+        raise ValueError(f'{field} is negative: {number}')
+    return number
+
+
+def _text(value, field, default=''):
+    if value in (None, ''):
+        return default
+    if not isinstance(value, str):
+        raise ValueError(f'{field} is not text: {value!r}')
+    return value.strip()
+
+
+def row_to_book(row):
+    """Validate one input row and build an unsaved Book; raise ValueError if bad."""
+    title = _text(row.get('title'), 'title')
+    author = _text(row.get('author'), 'author')
+    if not title or not author:
+        raise ValueError('title and author are required')
+    try:
+        publication_date = date.fromisoformat(str(row.get('publication_date') or '').strip())
+    except ValueError:
+        raise ValueError(f"publication_date is not YYYY-MM-DD: {row.get('publication_date')!r}")
+    category = _text(row.get('category'), 'category', 'fiction')
+    if category not in CATEGORIES:
+        raise ValueError(f'unknown category: {category!r}')
+    total = _int(row.get('total_copies'), 'total_copies', 1)
+    available = _int(row.get('available_copies'), 'available_copies', total)
+    if available > total:
+        raise ValueError(f'available_copies ({available}) exceeds total_copies ({total})')
+    return Book(
+        title=title[:200],
+        author=author[:200],
+        isbn=normalize_isbn(row.get('isbn') or ''),
+        description=_text(row.get('description'), 'description') or None,
+        category=category,
+        total_copies=total,
+        available_copies=available,
+        publication_date=publication_date,
+        pages=_int(row.get('pages'), 'pages'),
+    )
+
+
+def read_rows(stream, fmt):
+    """Yield (line_number, dict) pairs without loading the file into memory."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield line_number, exc
+                continue
+            yield line_number, row if isinstance(row, dict) else ValueError('not a JSON object')
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream books from CSV or JSON Lines files into the catalog, upserting "
+        "on ISBN in batches. Existing books keep their copy counts; every other "
+        "catalog field is refreshed from the file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help="Input files, or '-' for stdin.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Input format (default: from the file extension).')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--rejects', help='Write rejected rows to this JSON Lines file.')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive.')
+        rejects = open(options['rejects'], 'w') if options['rejects'] else None
+        self.totals = {'read': 0, 'imported': 0, 'rejected': 0}
+        started = time.monotonic()
+        try:
+            for path in options['paths']:
+                fmt = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+                if path == '-':
+                    self.import_stream(sys.stdin, fmt, path, batch_size, rejects, started)
+                    continue
+                try:
+                    stream = open(path, newline='', encoding='utf-8')
+                except OSError as exc:
+                    raise CommandError(exc)
+                with stream:
+                    self.import_stream(stream, fmt, path, batch_size, rejects, started)
+        finally:
+            if rejects:
+                rejects.close()
+
+        # bulk_create skips signals, so recount the homepage statistics once.
+        stats.reconcile()
+        cache.invalidate(cache.CATALOG)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.totals['imported']} of {self.totals['read']} rows "
+            f"({self.totals['rejected']} rejected) in {elapsed:.1f}s, "
+            f"{self.totals['read'] / max(elapsed, 1e-9):.0f} rows/s."
+        ))
+
+    def import_stream(self, stream, fmt, path, batch_size, rejects, started):
+        rows = read_rows(stream, fmt)
+        while True:
+            chunk = list(islice(rows, batch_size))
+            if not chunk:
+                break
+            # Keyed on ISBN so a repeated ISBN within one batch keeps the last
+            # row; ON CONFLICT cannot touch the same row twice in one statement.
+            books = {}
+            for line_number, row in chunk:
+                self.totals['read'] += 1
+                try:
+                    if isinstance(row, Exception):
+                        raise row
+                    book = row_to_book(row)
+                except ValueError as exc:
+                    self.reject(rejects, path, line_number, row, exc)
+                    continue
+                books[book.isbn] = book
+            self.write_batch(list(books.values()))
+            if self.verbosity >= 2:
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"{path}: {self.totals['read']} rows read, "
+                    f"{self.totals['read'] / max(elapsed, 1e-9):.0f} rows/s"
+                )
+
+    def write_batch(self, books):
+        if not books:
+            return
+        with transaction.atomic():
+            existing = set(Book.objects.filter(isbn__in=[book.isbn for book in books]).values_list('isbn', flat=True))
+            Book.objects.bulk_create(
+                books,
+                update_conflicts=True,
+                unique_fields=['isbn'],
+                update_fields=UPDATE_FIELDS,
+            )
+            # bulk_create skips the signal that records new books in the outbox.
+            LibraryEvent.objects.bulk_create([
+                LibraryEvent(kind='book_added', book_id=book.pk)
+                for book in books if book.isbn not in existing
+            ])
+        cache.invalidate(*[cache.book_scope(book.pk) for book in books if book.pk])
+        self.totals['imported'] += len(books)
+
+    def reject(self, rejects, path, line_number, row, error):
+        self.totals['rejected'] += 1
+        if rejects:
+            rejects.write(json.dumps({
+                'file': path,
+                'line': line_number,
+                'error': str(error),
+                'row': row if isinstance(row, dict) else None,
+            }) + '\n')
+        elif self.totals['rejected'] <= 10:
+            self.stderr.write(f'{path}:{line_number}: {error}')
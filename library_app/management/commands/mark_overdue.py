@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from library_app.services import mark_overdue
+
+
+class Command(BaseCommand):
+    help = (
+        "Mark borrowed loans past their due date as overdue, in chunked "
+        "set-based UPDATEs. Idempotent; run it from cron, or with --loop as a "
+        "long-running worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--loop', action='store_true', help='Keep running, sweeping every --interval seconds.')
+        parser.add_argument('--interval', type=float, default=300, help='Seconds between sweeps with --loop.')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive.')
+        try:
+            while True:
+                started = time.monotonic()
+                flipped = mark_overdue(chunk_size=options['chunk_size'])
+                self.stdout.write(
+                    f'{timezone.now():%Y-%m-%d %H:%M:%S} marked {flipped} loan(s) overdue '
+                    f'in {time.monotonic() - started:.2f}s'
+                )
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped.')
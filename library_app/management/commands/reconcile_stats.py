@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from library_app import stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount the homepage statistics from the source tables and fix any "
+        "drift in the stored counters. Safe to run periodically (e.g. from cron)."
+    )
+
+    def handle(self, *args, **options):
+        drift = stats.reconcile()
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Counters are accurate.'))
+            return
+        for name, delta in sorted(drift.items()):
+            self.stdout.write(f'{name}: corrected by {delta:+d}')
+        self.stdout.write(self.style.SUCCESS(f'Fixed {len(drift)} counter(s).'))
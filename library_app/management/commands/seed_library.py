@@ -0,0 +1,175 @@
+import itertools
+import random
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from library_app import cache, stats
+from library_app.models import LOAN_PERIOD, Book, BorrowRecord, UserProfile
+
+
+WORDS = (
+    'shadow river garden winter empire silent ocean crimson forest glass '
+    'machine memory stone summer kingdom hidden broken golden northern light '
+    'secret journey storm city night island mountain fire letters dream '
+    'history science code quantum atlas voyage harbor legacy spring echo'
+).split()
+FIRST_NAMES = 'Ada Alan Grace Mary Jane Leo Nina Omar Priya Sofia Tomas Yuki Zora Ivan Lena'.split()
+LAST_NAMES = 'Austen Borges Curie Dickens Eco Faulkner Gibson Hopper Ishiguro Jemisin Knuth Le Guin Morrison'.split()
+
+DEFAULT_PASSWORD = 'library-bench'
+USERNAME_PREFIX = 'reader'
+
+
+def isbn13(prefix, number):
+    first12 = '%s%09d' % (prefix, number)
+    total = sum(int(c) * (3 if i % 2 else 1) for i, c in enumerate(first12))
+    return first12 + str((10 - total % 10) % 10)
+
+
+def zipf_cum_weights(n, exponent):
+    """Cumulative weights so item k is picked with probability ~ 1/(k+1)^exponent."""
+    return list(itertools.accumulate(1.0 / (k + 1) ** exponent for k in range(n)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic library for load testing: books, members with "
+        "profiles, and loan history with Zipf-skewed book popularity. Every "
+        "member's password is --password. Adds to existing data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--loans', type=int, default=50000)
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Zipf exponent for book popularity (0 = uniform).')
+        parser.add_argument('--days', type=int, default=365, help='Spread loan history over this many days.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--password', default=DEFAULT_PASSWORD)
+
+    def handle(self, *args, **options):
+        if min(options['books'], options['users']) < 1 and options['loans']:
+            raise CommandError('Loans need at least one book and one user.')
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.monotonic()
+
+        book_ids, copies = self.create_books(options['books'])
+        user_ids = self.create_users(options['users'], options['password'])
+        if options['loans'] and book_ids and user_ids:
+            self.create_loans(options['loans'], book_ids, copies, user_ids, options['skew'], options['days'])
+
+        stats.reconcile()
+        cache.invalidate(cache.CATALOG)
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(book_ids)} books, {len(user_ids)} users and {options['loans']} loans "
+            f"in {time.monotonic() - started:.1f}s."
+        ))
+
+    def batches(self, iterable):
+        iterator = iter(iterable)
+        while batch := list(itertools.islice(iterator, self.batch_size)):
+            yield batch
+
+    def create_books(self, count):
+        rng = self.rng
+        # 979 prefixes keep seeded ISBNs apart from real 978 imports.
+        start = Book.objects.filter(isbn__startswith='979').count()
+        categories = [value for value, _ in Book.CATEGORY_CHOICES]
+        book_ids, copies = [], []
+
+        def books():
+            for n in range(start, start + count):
+                total = rng.choice((1, 1, 2, 3, 5))
+                yield Book(
+                    title=' '.join(rng.sample(WORDS, rng.randint(2, 4))).title(),
+                    author=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                    isbn=isbn13('979', n),
+                    description=' '.join(rng.choices(WORDS, k=30)),
+                    category=rng.choice(categories),
+                    total_copies=total,
+                    available_copies=total,
+                    publication_date=date(rng.randint(1900, 2025), rng.randint(1, 12), rng.randint(1, 28)),
+                    pages=rng.randint(80, 900),
+                )
+
+        for batch in self.batches(books()):
+            created = Book.objects.bulk_create(batch)
+            book_ids.extend(book.pk for book in created)
+            copies.extend(book.total_copies for book in created)
+        return book_ids, copies
+
+    def create_users(self, count, password):
+        start = User.objects.filter(username__startswith=USERNAME_PREFIX).count()
+        password_hash = make_password(password)  # hashing once, not per user
+        user_ids = []
+        for batch in self.batches(range(start, start + count)):
+            users = User.objects.bulk_create([
+                User(username=f'{USERNAME_PREFIX}{n}', email=f'{USERNAME_PREFIX}{n}@example.com',
+                     password=password_hash)
+                for n in batch
+            ])
+            UserProfile.objects.bulk_create([
+                # The first seeded member is a librarian, for the dashboards.
+                UserProfile(user=user, library_card_number=f'SEED{n:010d}', is_librarian=(n == 0))
+                for n, user in zip(batch, users)
+            ])
+            user_ids.extend(user.pk for user in users)
+        return user_ids
+
+    def create_loans(self, count, book_ids, copies, user_ids, skew, days):
+        rng = self.rng
+        now = timezone.now()
+        today = timezone.localdate()
+        book_weights = zipf_cum_weights(len(book_ids), skew)
+        user_weights = zipf_cum_weights(len(user_ids), 0.5)
+        open_loans = [0] * len(book_ids)
+        borrow_date_field = BorrowRecord._meta.get_field('borrow_date')
+        table = BorrowRecord._meta.db_table
+
+        def loans():
+            for _ in range(count):
+                book = rng.choices(range(len(book_ids)), cum_weights=book_weights)[0]
+                user = rng.choices(user_ids, cum_weights=user_weights)[0]
+                borrowed_at = now - timedelta(seconds=rng.randint(0, days * 86400))
+                due = borrowed_at.date() + LOAN_PERIOD
+                returned = borrowed_at.date() + timedelta(days=rng.randint(1, 21))
+                # Recent loans are likely still out, as long as a copy is free.
+                still_out = returned >= today or rng.random() < 0.02
+                if still_out and open_loans[book] < copies[book]:
+                    open_loans[book] += 1
+                    yield (user, book_ids[book], borrowed_at, due, None,
+                           'overdue' if due < today else 'borrowed')
+                else:
+                    returned = min(returned, today)
+                    yield (user, book_ids[book], borrowed_at, due, returned, 'returned')
+
+        # auto_now_add would overwrite borrow_date in bulk_create, so insert
+        # the history directly.
+        sql = (
+            f'INSERT INTO {table} (user_id, book_id, borrow_date, due_date, return_date, status) '
+            'VALUES (%s, %s, %s, %s, %s, %s)'
+        )
+        for batch in self.batches(loans()):
+            rows = [
+                (user, book, borrow_date_field.get_db_prep_value(borrowed_at, connection),
+                 due, returned, status)
+                for user, book, borrowed_at, due, returned, status in batch
+            ]
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+
+        out = [
+            Book(pk=book_ids[i], available_copies=copies[i] - n, updated_at=now)
+            for i, n in enumerate(open_loans) if n
+        ]
+        for batch in self.batches(out):
+            Book.objects.bulk_update(batch, ['available_copies', 'updated_at'])
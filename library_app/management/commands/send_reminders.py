@@ -0,0 +1,46 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from library_app import notices
+
+
+class Command(BaseCommand):
+    help = (
+        "Email members whose loans are due in --days days or overdue: one "
+        "message per member, sent in batches over one connection to "
+        "EMAIL_BACKEND. Each notice is recorded, so re-running (or running "
+        "after a crash) never repeats one. Run it daily from cron, or with "
+        "--loop as a worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.LIBRARY_REMINDER_DAYS,
+                            help='Remind members this many days before a loan is due.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Members per batch.')
+        parser.add_argument('--loop', action='store_true', help='Keep running, sending every --interval seconds.')
+        parser.add_argument('--interval', type=float, default=3600, help='Seconds between runs with --loop.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        if options['days'] < 0:
+            raise CommandError('--days cannot be negative.')
+        try:
+            while True:
+                started = time.monotonic()
+                members = loans = 0
+                for batch_members, batch_loans in notices.send(days=options['days'], batch_size=options['batch_size']):
+                    members += batch_members
+                    loans += batch_loans
+                self.stdout.write(
+                    f'{timezone.now():%Y-%m-%d %H:%M:%S} emailed {members} member(s) about '
+                    f'{loans} loan(s) in {time.monotonic() - started:.2f}s'
+                )
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped.')
@@ -0,0 +1,200 @@
+"""
+In-process request metrics in Prometheus text format.
+
+RequestMetricsMiddleware feeds one RequestSample per request into
+fixed-bucket histograms keyed by view, and the ``metrics`` view renders
+them for scraping.  Everything is kept in this process's memory behind a
+single lock: observing a request is a few dict lookups and integer
+increments.  With several worker processes each one reports its own
+numbers, so scrape them individually (or sum them in Prometheus).
+Database connection churn and, with DB_POOL, the psycopg pool's size and
+wait times are reported alongside.
+"""
+import bisect
+import re
+import threading
+from contextvars import ContextVar
+
+
+# Seconds.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Queries per request.
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+# Slowest statements remembered per view.
+SLOW_QUERIES_KEPT = 5
+
+current_sample = ContextVar('current_request_sample', default=None)
+
+
+class RequestSample:
+    """What one request cost; template time is added by the template backend."""
+
+    def __init__(self):
+        self.template_time = 0.0
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield '%s_bucket{%s,le="%s"} %d' % (name, labels, bound, cumulative)
+        cumulative += self.counts[-1]
+        yield '%s_bucket{%s,le="+Inf"} %d' % (name, labels, cumulative)
+        yield '%s_sum{%s} %r' % (name, labels, self.sum)
+        yield '%s_count{%s} %d' % (name, labels, cumulative)
+
+
+HISTOGRAMS = (
+    ('library_request_duration_seconds', 'Wall time per request.', DURATION_BUCKETS),
+    ('library_request_sql_queries', 'SQL queries per request.', QUERY_BUCKETS),
+    ('library_request_sql_duration_seconds', 'Time spent in SQL per request.', DURATION_BUCKETS),
+    ('library_request_template_duration_seconds', 'Template render time per request.', DURATION_BUCKETS),
+)
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.histograms = {name: Histogram(buckets) for name, _, buckets in HISTOGRAMS}
+        self.responses = {}
+        self.slow_queries = []  # (duration, sql), slowest first
+
+
+_lock = threading.Lock()
+_views = {}
+_collectors = []
+_connections_opened = {}
+
+
+def register_collector(collector):
+    """Add a callable returning extra exposition lines on every scrape."""
+    if collector not in _collectors:
+        _collectors.append(collector)
+
+
+def observe(view, status, duration, sample, queries):
+    """Record one finished request; queries is a list of (sql, seconds)."""
+    sql_time = sum(seconds for _, seconds in queries)
+    slowest = sorted(((seconds, sql) for sql, seconds in queries), reverse=True)[:SLOW_QUERIES_KEPT]
+    with _lock:
+        metrics = _views.get(view)
+        if metrics is None:
+            metrics = _views[view] = ViewMetrics()
+        histograms = metrics.histograms
+        histograms['library_request_duration_seconds'].observe(duration)
+        histograms['library_request_sql_queries'].observe(len(queries))
+        histograms['library_request_sql_duration_seconds'].observe(sql_time)
+        histograms['library_request_template_duration_seconds'].observe(sample.template_time)
+        metrics.responses[status] = metrics.responses.get(status, 0) + 1
+        if slowest and (len(metrics.slow_queries) < SLOW_QUERIES_KEPT
+                        or slowest[0][0] > metrics.slow_queries[-1][0]):
+            merged = dict((sql, seconds) for seconds, sql in metrics.slow_queries)
+            for seconds, sql in slowest:
+                merged[sql] = max(seconds, merged.get(sql, 0.0))
+            metrics.slow_queries = sorted(
+                ((seconds, sql) for sql, seconds in merged.items()), reverse=True,
+            )[:SLOW_QUERIES_KEPT]
+
+
+def reset():
+    with _lock:
+        _views.clear()
+
+
+def count_connection(sender, connection, **kwargs):
+    """connection_created receiver: with persistent or pooled connections this stays flat."""
+    with _lock:
+        _connections_opened[connection.alias] = _connections_opened.get(connection.alias, 0) + 1
+
+
+# psycopg_pool statistic: (metric, type, help, scale)
+POOL_STATS = {
+    'pool_max': ('library_db_pool_max_size', 'gauge', 'Largest size the pool may grow to.', 1),
+    'pool_size': ('library_db_pool_size', 'gauge', 'Connections in the pool, busy or idle.', 1),
+    'pool_available': ('library_db_pool_available', 'gauge', 'Idle connections in the pool.', 1),
+    'requests_waiting': ('library_db_pool_requests_waiting', 'gauge', 'Requests queued for a connection.', 1),
+    'requests_num': ('library_db_pool_requests_total', 'counter', 'Connections handed out.', 1),
+    'requests_wait_ms': (
+        'library_db_pool_wait_seconds_total', 'counter', 'Time requests spent waiting for a connection.', 0.001,
+    ),
+    'requests_errors': ('library_db_pool_timeouts_total', 'counter', 'Requests that gave up waiting.', 1),
+    'connections_ms': (
+        'library_db_pool_connect_seconds_total', 'counter', 'Time spent opening pool connections.', 0.001,
+    ),
+}
+
+
+def database_lines():
+    """Collector: connections opened per alias, plus psycopg pool statistics."""
+    from django.db import connections
+
+    with _lock:
+        opened = sorted(_connections_opened.items())
+    lines = [
+        '# HELP library_db_connections_opened_total Database connections opened by this process.',
+        '# TYPE library_db_connections_opened_total counter',
+    ]
+    lines.extend('library_db_connections_opened_total{alias="%s"} %d' % item for item in opened)
+
+    pools = [
+        (alias, connections[alias].pool.get_stats())
+        for alias in connections
+        if connections.settings[alias].get('OPTIONS', {}).get('pool')
+    ]
+    for key, (name, kind, help_text, scale) in POOL_STATS.items():
+        if not pools:
+            break
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s %s' % (name, kind))
+        for alias, pool_stats in pools:
+            lines.append('%s{alias="%s"} %r' % (name, alias, pool_stats.get(key, 0) * scale))
+    return lines
+
+
+def _summarize(sql):
+    # The column list is noise in a label; keep FROM onwards.
+    return re.sub(r'^SELECT .*? FROM ', 'SELECT ... FROM ', sql, count=1, flags=re.S)[:300]
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+def render_prometheus():
+    """The current metrics in the Prometheus text exposition format."""
+    with _lock:
+        snapshot = sorted(_views.items())
+        lines = []
+        for name, help_text, _ in HISTOGRAMS:
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s histogram' % name)
+            for view, metrics in snapshot:
+                lines.extend(metrics.histograms[name].lines(name, 'view="%s"' % _label(view)))
+        lines.append('# HELP library_responses_total Responses by view and status code.')
+        lines.append('# TYPE library_responses_total counter')
+        for view, metrics in snapshot:
+            for status, count in sorted(metrics.responses.items()):
+                lines.append('library_responses_total{view="%s",status="%d"} %d' % (_label(view), status, count))
+        lines.append('# HELP library_slow_query_seconds Slowest SQL statements seen per view.')
+        lines.append('# TYPE library_slow_query_seconds gauge')
+        for view, metrics in snapshot:
+            seen = set()
+            for seconds, sql in metrics.slow_queries:
+                summary = _label(_summarize(sql))
+                if summary not in seen:  # label sets must be unique
+                    seen.add(summary)
+                    lines.append('library_slow_query_seconds{view="%s",sql="%s"} %r' % (
+                        _label(view), summary, seconds,
+                    ))
+    for collector in _collectors:
+        lines.extend(collector())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,110 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import metrics, routers
+from .querybudget import QueryTracker
+
+
+slow_logger = logging.getLogger('library_app.slow')
+
+
+class RequestMetricsMiddleware:
+    """
+    Time every request and count its SQL and template work per view.
+
+    Results go to library_app.metrics; requests slower than
+    LIBRARY_SLOW_REQUEST_MS are also logged with their SQL.  Place it first
+    in MIDDLEWARE so the whole stack is measured.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        sample = metrics.RequestSample()
+        token = metrics.current_sample.set(sample)
+        started = time.perf_counter()
+        try:
+            with QueryTracker() as tracker:
+                response = self.get_response(request)
+        finally:
+            metrics.current_sample.reset(token)
+        self.record(request, response, time.perf_counter() - started, sample, tracker)
+        return response
+
+    async def __acall__(self, request):
+        sample = metrics.RequestSample()
+        token = metrics.current_sample.set(sample)
+        started = time.perf_counter()
+        try:
+            with QueryTracker() as tracker:
+                response = await self.get_response(request)
+        finally:
+            metrics.current_sample.reset(token)
+        self.record(request, response, time.perf_counter() - started, sample, tracker)
+        return response
+
+    def record(self, request, response, duration, sample, tracker):
+        match = getattr(request, 'resolver_match', None)
+        view = match._func_path if match else '<unresolved>'
+        metrics.observe(view, response.status_code, duration, sample, tracker.queries)
+        if duration * 1000 >= settings.LIBRARY_SLOW_REQUEST_MS:
+            slowest = sorted(tracker.queries, key=lambda query: query[1], reverse=True)
+            slow_logger.warning(
+                'Slow request: %s %s -> %s in %.0fms (%d queries, %.0fms SQL, %.0fms templates)\n%s',
+                request.method, request.get_full_path(), view, duration * 1000,
+                tracker.count, tracker.duration * 1000, sample.template_time * 1000,
+                '\n'.join('  %.1fms %s' % (seconds * 1000, sql) for sql, seconds in slowest),
+            )
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Read from the primary database for a while after a client writes.
+
+    A request that writes a replicated model gets the routers.STICKY_COOKIE
+    cookie for DB_REPLICA_STICKY_SECONDS; requests carrying it skip the
+    replicas, so members see their own borrows and returns immediately.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = routers.begin_request(routers.STICKY_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.end_request(token)
+        return self.mark(state, response)
+
+    async def __acall__(self, request):
+        state, token = routers.begin_request(routers.STICKY_COOKIE in request.COOKIES)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.end_request(token)
+        return self.mark(state, response)
+
+    def mark(self, state, response):
+        if state.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                routers.STICKY_COOKIE, '1',
+                max_age=settings.DB_REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
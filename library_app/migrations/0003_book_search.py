@@ -0,0 +1,20 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+from library_app.search import install_search_index, uninstall_search_index
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0002_book_available_not_exceed_total'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
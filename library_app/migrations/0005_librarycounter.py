@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_counters(apps, schema_editor):
+    Book = apps.get_model('library_app', 'Book')
+    BorrowRecord = apps.get_model('library_app', 'BorrowRecord')
+    LibraryCounter = apps.get_model('library_app', 'LibraryCounter')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    LibraryCounter.objects.bulk_create([
+        LibraryCounter(name='total_books', value=Book.objects.count()),
+        LibraryCounter(name='available_books', value=Book.objects.filter(available_copies__gt=0).count()),
+        LibraryCounter(name='total_users', value=User.objects.count()),
+        LibraryCounter(name='total_borrowed', value=BorrowRecord.objects.filter(status='borrowed').count()),
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0004_keyset_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibraryCounter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_overdue_counter(apps, schema_editor):
+    BorrowRecord = apps.get_model('library_app', 'BorrowRecord')
+    LibraryCounter = apps.get_model('library_app', 'LibraryCounter')
+    LibraryCounter.objects.update_or_create(
+        name='total_overdue',
+        defaults={'value': BorrowRecord.objects.filter(status='overdue').count()},
+    )
+    # Open loans now include overdue ones (see OPEN_STATUSES).
+    LibraryCounter.objects.update_or_create(
+        name='total_borrowed',
+        defaults={'value': BorrowRecord.objects.filter(status__in=['borrowed', 'overdue']).count()},
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0006_borrow_open_due_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyLoanRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('category', models.CharField(choices=[('fiction', 'Fiction'), ('non_fiction', 'Non-Fiction'), ('science', 'Science'), ('technology', 'Technology'), ('history', 'History'), ('biography', 'Biography'), ('mystery', 'Mystery'), ('romance', 'Romance')], max_length=50)),
+                ('borrowed', models.PositiveIntegerField(default=0)),
+                ('returned', models.PositiveIntegerField(default=0)),
+                ('overdue', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-day', 'category'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='borrowrecord',
+            index=models.Index(fields=['borrow_date'], name='borrow_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowrecord',
+            index=models.Index(fields=['return_date'], name='borrow_return_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowrecord',
+            index=models.Index(fields=['due_date'], name='borrow_due_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyloanrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'category'), name='rollup_day_category_unique'),
+        ),
+        migrations.RunPython(seed_overdue_counter, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0008_hold'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BorrowRecordArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('borrow_date', models.DateTimeField()),
+                ('due_date', models.DateField()),
+                ('return_date', models.DateField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('borrowed', 'Borrowed'), ('returned', 'Returned'), ('overdue', 'Overdue')], default='returned', max_length=20)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_borrow_records', to='library_app.book')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_borrow_records', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-borrow_date', '-id'],
+                'indexes': [models.Index(fields=['user', '-borrow_date', '-id'], name='archive_user_date_idx'), models.Index(fields=['borrow_date'], name='archive_borrow_date_idx'), models.Index(fields=['return_date'], name='archive_return_date_idx'), models.Index(fields=['due_date'], name='archive_due_date_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0010_recommendations'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['category', '-created_at', '-id'], name='book_category_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['category', 'available_copies', 'publication_date'], name='book_facet_idx'),
+        ),
+    ]
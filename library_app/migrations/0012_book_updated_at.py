@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:41
+
+from django.db import migrations, models
+
+from library_app.search import install_search_index
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0011_book_facet_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        # SQLite rebuilds library_app_book to add the column, which drops
+        # the full-text search triggers.
+        migrations.RunPython(install_search_index, migrations.RunPython.noop),
+    ]
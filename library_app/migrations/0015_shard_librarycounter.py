@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Shards created up front; stats.adjust() creates any others it picks.
+SHARDS = 16
+
+
+def seed_counters(apps, schema_editor):
+    # The table is rebuilt with a new key, so recount rather than copy.
+    Book = apps.get_model('library_app', 'Book')
+    BorrowRecord = apps.get_model('library_app', 'BorrowRecord')
+    LibraryCounter = apps.get_model('library_app', 'LibraryCounter')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    totals = {
+        'total_books': Book.objects.count(),
+        'available_books': Book.objects.filter(available_copies__gt=0).count(),
+        'total_users': User.objects.count(),
+        'total_borrowed': BorrowRecord.objects.filter(status__in=('borrowed', 'overdue')).count(),
+        'total_overdue': BorrowRecord.objects.filter(status='overdue').count(),
+    }
+    LibraryCounter.objects.bulk_create([
+        LibraryCounter(name=name, shard=shard, value=value if shard == 0 else 0)
+        for name, value in totals.items()
+        for shard in range(SHARDS)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0014_libraryevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.DeleteModel(name='LibraryCounter'),
+        migrations.CreateModel(
+            name='LibraryCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('shard', models.PositiveSmallIntegerField(default=0)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [
+                    models.UniqueConstraint(fields=('name', 'shard'), name='counter_name_shard_unique'),
+                ],
+            },
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0015_shard_librarycounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loannotice',
+            name='batch',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,8 +1,22 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
+from django.utils import timezone
 from datetime import timedelta, date
 # Create your models here.
 
+LOAN_PERIOD = timedelta(days=14)
+
+# Loan statuses that still hold a copy of the book.
+OPEN_STATUSES = ('borrowed', 'overdue')
+
+# How long a copy set aside for a hold waits to be collected.
+HOLD_PICKUP_PERIOD = timedelta(days=3)
+
+# Hold statuses still in a book's queue or holding a copy.
+ACTIVE_HOLD_STATUSES = ('waiting', 'ready')
+
+
 class Book(models.Model):
     CATEGORY_CHOICES = [
         ('fiction', 'Fiction'),
@@ -25,12 +39,24 @@ class Book(models.Model):
     publication_date = models.DateField()
     pages = models.IntegerField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Versions cached book cards; UPDATEs that bypass save() must set it too.
+    updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by a database trigger on PostgreSQL (see migration 0003).
+    search_vector = SearchVectorField(null=True, editable=False)
     
     class Meta:
         constraints = [
             models.CheckConstraint(check=models.Q(available_copies__lte=models.F('total_copies')), name='available_not_exceed_total')
         ]
-        ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the catalog (see pagination.py).
+            models.Index(fields=['-created_at', '-id'], name='book_created_id_idx'),
+            # Browsing one category, newest first.
+            models.Index(fields=['category', '-created_at', '-id'], name='book_category_created_idx'),
+            # Covers the facet count query (see facets.py).
+            models.Index(fields=['category', 'available_copies', 'publication_date'], name='book_facet_idx'),
+        ]
+        ordering = ['-created_at', '-id']
     
     def __str__(self):
         return f"{self.title} by {self.author}"
@@ -66,9 +92,23 @@ class BorrowRecord(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='borrowed')
     
     class Meta:
-        ordering = ['-borrow_date']
+        indexes = [
+            # A user's loans by status, newest first (borrowed_books, keyset paginated).
+            models.Index(fields=['user', 'status', '-borrow_date', '-id'], name='borrow_user_status_date_idx'),
+            # Open loans by due date, for the overdue sweeper.
+            models.Index(fields=['due_date'], condition=models.Q(status='borrowed'), name='borrow_open_due_idx'),
+            # Day-by-day activity for the rollups (see reports.py).
+            models.Index(fields=['borrow_date'], name='borrow_date_idx'),
+            models.Index(fields=['return_date'], name='borrow_return_date_idx'),
+            models.Index(fields=['due_date'], name='borrow_due_date_idx'),
+            # Overdue loans member by member, for the reminder mailer (see notices.py).
+            models.Index(fields=['user', 'id'], condition=models.Q(status='overdue'), name='borrow_overdue_user_idx'),
+        ]
+        ordering = ['-borrow_date', '-id']
     
     def __str__(self):
+        # Touches two relations: fetch records with select_related('user', 'book')
+        # wherever they are listed (the admin does, via list_select_related).
         return f"{self.user.username} borrowed {self.book.title}"
     
     def is_overdue(self):
@@ -77,22 +117,219 @@ class BorrowRecord(models.Model):
         return False
     
     def save(self, *args, **kwargs):
-        # If new record and status is borrowed → reduce available copies
-        if not self.pk and self.status == 'borrowed':
-            if self.book.available_copies > 0:
-                self.book.available_copies -= 1
-                self.book.save()
-
-        # If existing record and status changed to returned → increase available copies
-        elif self.pk:
-            old_status = BorrowRecord.objects.get(pk=self.pk).status
-            if old_status != self.status and self.status == 'returned':
-                if self.book.available_copies < self.book.total_copies:
-                    self.book.available_copies += 1
-                    self.book.save()
+        # Inventory is adjusted atomically by library_app.services, not here.
 
         # Auto-set due date if missing
         if not self.due_date:
-            self.due_date = (self.borrow_date + timedelta(days=14)).date()
+            self.due_date = (self.borrow_date or timezone.now()).date() + LOAN_PERIOD
+
+        super().save(*args, **kwargs)
+
+
+class BorrowRecordArchive(models.Model):
+    """
+    A returned loan moved out of BorrowRecord by ``manage.py archive_loans``.
+
+    Rows keep their BorrowRecord id, so ids stay unique across both tables
+    and re-running an interrupted move is harmless.  Read a member's whole
+    history through reports.loan_history rather than either table alone.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_borrow_records')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='archived_borrow_records')
+    borrow_date = models.DateTimeField()
+    due_date = models.DateField()
+    return_date = models.DateField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=BorrowRecord.STATUS_CHOICES, default='returned')
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-borrow_date', '-id'], name='archive_user_date_idx'),
+            # Rollup backfills (see reports.rollup_day).
+            models.Index(fields=['borrow_date'], name='archive_borrow_date_idx'),
+            models.Index(fields=['return_date'], name='archive_return_date_idx'),
+            models.Index(fields=['due_date'], name='archive_due_date_idx'),
+        ]
+        ordering = ['-borrow_date', '-id']
+
+    def __str__(self):
+        return f"Archived loan {self.pk} of book {self.book_id}"
+
+
+class Hold(models.Model):
+    """
+    A member's place in the queue for a book with no copies left.
+
+    Holds are served oldest first: a returned copy is set aside for the
+    first waiting hold (which becomes 'ready') instead of going back on the
+    shelf; see library_app.services.
+    """
+    STATUS_CHOICES = [
+        ('waiting', 'Waiting'),
+        ('ready', 'Ready for pickup'),
+        ('fulfilled', 'Fulfilled'),
+        ('expired', 'Expired'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='holds')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='holds')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='waiting')
+    created_at = models.DateTimeField(auto_now_add=True)
+    ready_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'book'],
+                condition=models.Q(status__in=ACTIVE_HOLD_STATUSES),
+                name='hold_one_active_per_user_book',
+            ),
+        ]
+        indexes = [
+            # Each book's queue, oldest first.
+            models.Index(fields=['book', 'created_at', 'id'], condition=models.Q(status='waiting'),
+                         name='hold_queue_idx'),
+            # Uncollected copies by deadline, for expire_holds.
+            models.Index(fields=['expires_at'], condition=models.Q(status='ready'), name='hold_ready_expiry_idx'),
+            # A member's holds on their dashboard.
+            models.Index(fields=['user', 'status'], name='hold_user_status_idx'),
+        ]
+        ordering = ['created_at', 'id']
+
+    def __str__(self):
+        return f"Hold {self.pk} on book {self.book_id} ({self.status})"
+
+
+class LoanNotice(models.Model):
+    """
+    A reminder or overdue notice emailed about a loan, by ``manage.py send_reminders``.
+
+    Recorded before the email goes out, so a crash mid-batch never sends the
+    same notice twice.  Keyed on the due date as well, so a loan whose due
+    date moves is reminded again.
+    """
+    KIND_CHOICES = [
+        ('due_soon', 'Due soon'),
+        ('overdue', 'Overdue'),
+    ]
+
+    # No database constraint: archive_loans deletes returned loans with raw
+    # SQL and clears their notices itself.
+    loan = models.ForeignKey(BorrowRecord, on_delete=models.DO_NOTHING, db_constraint=False, related_name='notices')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='loan_notices')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    due_date = models.DateField()
+    sent_at = models.DateTimeField(auto_now_add=True)
+    # The send_reminders batch that recorded it, so a run can tell its own
+    # inserts from a concurrent run's (see notices.claim).
+    batch = models.UUIDField(null=True, blank=True, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['loan', 'kind', 'due_date'], name='loan_notice_once'),
+        ]
+        ordering = ['-sent_at', '-id']
 
-        super().save(*args, **kwargs)
\ No newline at end of file
+    def __str__(self):
+        return f"{self.get_kind_display()} notice for loan {self.loan_id}"
+
+
+class LibraryEvent(models.Model):
+    """
+    A borrow, return, new book or new member, appended by library_app.events.
+
+    Written in the same transaction as the change it records and never
+    updated; ``manage.py consume_events`` reads it in id order.
+    """
+    KIND_CHOICES = [
+        ('borrowed', 'Borrowed'),
+        ('returned', 'Returned'),
+        ('book_added', 'Book added'),
+        ('member_joined', 'Member joined'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # No database constraints: the log outlives the rows it mentions, and
+    # archive_loans moves loans out of BorrowRecord with their ids intact.
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True,
+                             related_name='+')
+    book = models.ForeignKey(Book, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True,
+                             related_name='+')
+    loan_id = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind}"
+
+
+class BookRecommendation(models.Model):
+    """One of a book's top "readers also borrowed" neighbours, by rank."""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    # Members who borrowed both, and that count's cosine similarity.
+    co_borrows = models.PositiveIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'rank'], name='recommendation_book_rank_unique'),
+        ]
+        ordering = ['book_id', 'rank']
+
+    def __str__(self):
+        return f"{self.book_id} -> {self.recommended_id} (#{self.rank})"
+
+
+class JobCheckpoint(models.Model):
+    """How far an incremental batch job has got, e.g. the last loan id it saw."""
+    name = models.CharField(max_length=50, primary_key=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
+
+
+class LibraryCounter(models.Model):
+    """
+    One shard of a named running total maintained by library_app.stats.
+
+    A total is the sum of its shards' values; writers each pick one shard,
+    so concurrent loans rarely queue on the same row lock.
+    """
+    name = models.CharField(max_length=50)
+    shard = models.PositiveSmallIntegerField(default=0)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'shard'], name='counter_name_shard_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.name}[{self.shard}] = {self.value}"
+
+
+class DailyLoanRollup(models.Model):
+    """Loans opened, closed and gone overdue per category per day."""
+    day = models.DateField()
+    category = models.CharField(max_length=50, choices=Book.CATEGORY_CHOICES)
+    borrowed = models.PositiveIntegerField(default=0)
+    returned = models.PositiveIntegerField(default=0)
+    overdue = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category'], name='rollup_day_category_unique')
+        ]
+        ordering = ['-day', 'category']
+
+    def __str__(self):
+        return f"{self.day} {self.category}"
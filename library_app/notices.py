@@ -0,0 +1,105 @@
+"""
+Due-date reminders and overdue notices by email.
+
+pending() finds every loan that needs a notice in one query: loans due in
+LIBRARY_REMINDER_DAYS days (borrow_open_due_idx), overdue loans
+(borrow_overdue_user_idx, plus borrowed ones mark_overdue has not flipped
+yet), minus those already noticed (the loan_notice_once index), member by
+member.  send() streams that, writes one email per member and hands each
+batch's emails to the email backend in one send_messages() call over a
+single connection.
+
+A batch's LoanNotice rows are committed before its emails go out, so a
+crash or a failed send can drop the notices of the batch in flight (at most
+--batch-size members) but never send one twice.
+"""
+import uuid
+from datetime import timedelta
+from itertools import groupby, islice
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Case, CharField, Exists, OuterRef, Q, Value, When
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import BorrowRecord, LoanNotice
+
+
+FIELDS = ('id', 'user_id', 'user__email', 'user__first_name', 'user__username', 'book__title', 'due_date', 'kind')
+
+
+def pending(today=None, days=None):
+    """Loans owed a notice, as dicts with a 'kind', ordered by member."""
+    today = today or timezone.localdate()
+    days = settings.LIBRARY_REMINDER_DAYS if days is None else days
+    overdue = Q(status='overdue') | Q(status='borrowed', due_date__lt=today)
+    loans = (
+        BorrowRecord.objects
+        .filter(overdue | Q(status='borrowed', due_date=today + timedelta(days=days)))
+        .exclude(user__email='')
+        .annotate(kind=Case(When(overdue, then=Value('overdue')), default=Value('due_soon'),
+                            output_field=CharField()))
+    )
+    already_sent = LoanNotice.objects.filter(
+        loan=OuterRef('pk'), kind=OuterRef('kind'), due_date=OuterRef('due_date'),
+    )
+    return loans.filter(~Exists(already_sent)).order_by('user_id', 'id').values(*FIELDS)
+
+
+def build_message(loans):
+    """One member's email covering all of their loans in loans."""
+    member = loans[0]
+    overdue = [loan for loan in loans if loan['kind'] == 'overdue']
+    due_soon = [loan for loan in loans if loan['kind'] == 'due_soon']
+    body = render_to_string('emails/loan_reminder.txt', {
+        'name': member['user__first_name'] or member['user__username'],
+        'overdue': overdue,
+        'due_soon': due_soon,
+    })
+    subject = 'Overdue library books' if overdue else 'Library books due soon'
+    return EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [member['user__email']])
+
+
+def claim(batch):
+    """
+    Record a notice for every loan in batch (a list of members' loan lists).
+
+    Returns the members' loans whose notices this call recorded, dropping
+    members left with none: loans a concurrent run recorded first are that
+    run's to email.
+    """
+    token = uuid.uuid4()
+    loans = [loan for member in batch for loan in member]
+    with transaction.atomic():
+        LoanNotice.objects.bulk_create([
+            LoanNotice(loan_id=loan['id'], user_id=loan['user_id'], kind=loan['kind'],
+                       due_date=loan['due_date'], batch=token)
+            for loan in loans
+        ], ignore_conflicts=True)
+    claimed = set(
+        LoanNotice.objects
+        .filter(loan_id__in=[loan['id'] for loan in loans], batch=token)
+        .values_list('loan_id', 'kind')
+    )
+    batch = [[loan for loan in member if (loan['id'], loan['kind']) in claimed] for member in batch]
+    return [member for member in batch if member]
+
+
+def send(today=None, days=None, batch_size=500, connection=None):
+    """
+    Email every member with loans owed a notice.
+
+    A generator yielding (members emailed, loans covered) per batch.  Opens
+    the connection once and sends each batch with one send_messages() call.
+    """
+    connection = connection or get_connection()
+    members = groupby(pending(today, days).iterator(chunk_size=2000), key=itemgetter('user_id'))
+    with connection:
+        while batch := [list(loans) for _, loans in islice(members, batch_size)]:
+            batch = claim(batch)
+            if batch:
+                connection.send_messages([build_message(loans) for loans in batch])
+            yield len(batch), sum(len(loans) for loans in batch)
@@ -0,0 +1,178 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are addressed by the ordering values of the last row seen rather than
+by an OFFSET, so fetching page N costs the same index range scan as page 1.
+The ordering must end in a unique column (``-id``) to break ties.
+"""
+import base64
+import datetime
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder rounds datetimes to milliseconds; cursors must be exact.
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPage:
+    """One page of results plus opaque cursors for its neighbours."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def encode_cursor(direction, values):
+    payload = json.dumps([direction, values], cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (direction, values), or (None, None) for a missing/garbled cursor."""
+    if not cursor:
+        return None, None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None, None
+    if direction not in (NEXT, PREVIOUS) or not isinstance(values, list):
+        return None, None
+    return direction, values
+
+
+def get_page_size(request):
+    """The ?page_size= parameter, clamped to LIBRARY_MAX_PAGE_SIZE."""
+    try:
+        size = int(request.GET.get('page_size', settings.LIBRARY_PAGE_SIZE))
+    except ValueError:
+        size = settings.LIBRARY_PAGE_SIZE
+    return max(1, min(size, settings.LIBRARY_MAX_PAGE_SIZE))
+
+
+def _field(name):
+    return (name[1:], True) if name.startswith('-') else (name, False)
+
+
+def _after(ordering, values):
+    """Q matching rows strictly after values in the given ordering."""
+    fields = [_field(name) for name in ordering]
+    condition = Q()
+    for i, (name, descending) in enumerate(fields):
+        equal = {prev: values[j] for j, (prev, _) in enumerate(fields[:i])}
+        lookup = '%s__%s' % (name, 'lt' if descending else 'gt')
+        condition |= Q(**equal, **{lookup: values[i]})
+    # Bound the leading column too, so the planner can range-scan its index.
+    name, descending = fields[0]
+    bound = Q(**{'%s__%s' % (name, 'lte' if descending else 'gte'): values[0]})
+    return bound & condition
+
+
+def _reverse(ordering):
+    return [name[1:] if name.startswith('-') else '-' + name for name in ordering]
+
+
+def _key(obj, ordering):
+    if isinstance(obj, dict):
+        return [obj[_field(name)[0]] for name in ordering]
+    return [getattr(obj, _field(name)[0]) for name in ordering]
+
+
+def _keyset(queryset, ordering, cursor):
+    """
+    Narrow queryset to the rows past cursor.
+
+    Returns (queryset, the ordering to fetch in, direction); a PREVIOUS page
+    is fetched in reverse and flipped back by _build_page.
+    """
+    direction, values = decode_cursor(cursor)
+    if values is not None and len(values) != len(ordering):
+        direction = values = None
+    try:
+        if direction == PREVIOUS:
+            queryset = queryset.filter(_after(_reverse(ordering), values))
+        elif direction == NEXT:
+            queryset = queryset.filter(_after(ordering, values))
+    except (ValidationError, ValueError, TypeError):
+        # A tampered cursor; start again from the first page.
+        direction = None
+    return queryset, _reverse(ordering) if direction == PREVIOUS else ordering, direction
+
+
+def _build_page(rows, ordering, direction, page_size):
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if direction == PREVIOUS:
+        rows = rows[::-1]
+        has_before, has_after = has_more, True
+    else:
+        has_before, has_after = direction == NEXT, has_more
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(NEXT, _key(rows[-1], ordering)) if rows and has_after else None,
+        previous_cursor=encode_cursor(PREVIOUS, _key(rows[0], ordering)) if rows and has_before else None,
+    )
+
+
+def paginate(queryset, ordering, cursor=None, page_size=None):
+    """
+    Return the KeysetPage of queryset selected by cursor.
+
+    ordering is a list such as ``['-created_at', '-id']``; every column in it
+    must be readable as an attribute of the returned objects.
+    """
+    page_size = page_size or settings.LIBRARY_PAGE_SIZE
+    queryset, fetch_order, direction = _keyset(queryset, ordering, cursor)
+    rows = list(queryset.order_by(*fetch_order)[:page_size + 1])
+    return _build_page(rows, ordering, direction, page_size)
+
+
+async def apaginate(queryset, ordering, cursor=None, page_size=None):
+    """Async paginate(), for async views."""
+    page_size = page_size or settings.LIBRARY_PAGE_SIZE
+    queryset, fetch_order, direction = _keyset(queryset, ordering, cursor)
+    rows = [obj async for obj in queryset.order_by(*fetch_order)[:page_size + 1]]
+    return _build_page(rows, ordering, direction, page_size)
+
+
+def paginate_union(querysets, ordering, cursor=None, page_size=None):
+    """
+    paginate() over the UNION ALL of querysets, in one query.
+
+    The querysets must select the same columns with .values(), including
+    every column in ordering, and the last of those must be unique across
+    all of them.  The cursor condition is applied to each part, so each one
+    still range-scans its own index.
+    """
+    page_size = page_size or settings.LIBRARY_PAGE_SIZE
+    parts = [_keyset(queryset, ordering, cursor) for queryset in querysets]
+    _, fetch_order, direction = parts[0]
+    first, *rest = [queryset.order_by() for queryset, _, _ in parts]
+    rows = list(first.union(*rest, all=True).order_by(*fetch_order)[:page_size + 1])
+    return _build_page(rows, ordering, direction, page_size)
@@ -0,0 +1,111 @@
+"""
+SQL query accounting and per-view query budgets.
+
+A wrapper installed on every database connection reports each query to the
+QueryTrackers active in the current context.  The active set lives in a
+context variable, so tracking follows a request into async code and the
+sync_to_async threads the ORM runs on, and covers every database alias.
+
+Views declare how many queries they may issue with ``@query_budget(n)``.
+Going over budget raises QueryBudgetExceeded when QUERY_BUDGET_STRICT is on
+(the default under DEBUG) and logs a warning with the offending SQL
+otherwise.  Tests can assert budgets with library_app.testing.
+"""
+import functools
+import logging
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+_active_trackers = ContextVar('active_query_trackers', default=())
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryTracker:
+    """Context manager counting (and timing) the queries run inside it."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.queries = []
+
+    def __enter__(self):
+        self._token = _active_trackers.set(_active_trackers.get() + (self,))
+        return self
+
+    def __exit__(self, *exc_info):
+        _active_trackers.reset(self._token)
+
+    def record(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        self.queries.append((sql, duration))
+
+
+def _track_queries(execute, sql, params, many, context):
+    trackers = _active_trackers.get()
+    if not trackers:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        for tracker in trackers:
+            tracker.record(sql, duration)
+
+
+def install(connection, **kwargs):
+    """Attach the tracking wrapper to connection (a connection_created receiver)."""
+    if _track_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_track_queries)
+
+
+def install_all():
+    for connection in connections.all(initialized_only=True):
+        install(connection)
+
+
+def check_budget(name, tracker, limit):
+    if tracker.count <= limit:
+        return
+    message = '%s ran %d queries (budget %d):\n%s' % (
+        name, tracker.count, limit, '\n'.join(sql for sql, _ in tracker.queries),
+    )
+    if getattr(settings, 'QUERY_BUDGET_STRICT', settings.DEBUG):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+def query_budget(limit):
+    """Declare the most SQL queries a view may issue, including its template."""
+    def decorator(view_func):
+        name = '%s.%s' % (view_func.__module__, view_func.__qualname__)
+
+        if iscoroutinefunction(view_func):
+            async def wrapper(request, *args, **kwargs):
+                with QueryTracker() as tracker:
+                    response = await view_func(request, *args, **kwargs)
+                check_budget(name, tracker, limit)
+                return response
+            markcoroutinefunction(wrapper)
+        else:
+            def wrapper(request, *args, **kwargs):
+                with QueryTracker() as tracker:
+                    response = view_func(request, *args, **kwargs)
+                check_budget(name, tracker, limit)
+                return response
+
+        wrapper = functools.wraps(view_func)(wrapper)
+        wrapper.query_budget = limit
+        return wrapper
+    return decorator
@@ -0,0 +1,152 @@
+"""
+"Readers also borrowed" recommendations.
+
+Two books are related when the same members borrowed both.  refresh()
+builds the member x book borrow matrix from BorrowRecord and its archive
+as a scipy.sparse matrix, multiplies out the co-borrow counts of the books
+that need refreshing, and stores each one's top neighbours (by cosine
+similarity) in BookRecommendation, so book_detail needs one indexed lookup.
+
+Incremental runs only refresh the books whose neighbours can have changed
+since the last run: those borrowed since, plus every book that shares a
+borrower with one of them, since a book's borrower count feeds the score of
+each of its neighbours.  A run after loans of a bestseller therefore
+refreshes most of the catalog.  The last loan id seen is kept in a
+JobCheckpoint.  numpy and scipy are only needed by refresh(), not to serve
+pages.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from . import cache
+from .models import BookRecommendation, BorrowRecord, BorrowRecordArchive, JobCheckpoint
+
+
+CHECKPOINT = 'recommendations'
+
+# Books whose co-borrow counts are multiplied out at once; bounds memory.
+BLOCK_SIZE = 2000
+
+
+def for_book(book_id):
+    """A book's BookRecommendations, best first, with the recommended books."""
+    return (
+        BookRecommendation.objects
+        .filter(book_id=book_id)
+        .select_related('recommended')
+        .only('rank', 'recommended__title', 'recommended__author')
+        .order_by('rank')
+    )
+
+
+async def afor_book(book_id):
+    """The recommended Books themselves, in one query."""
+    return [recommendation.recommended async for recommendation in for_book(book_id)]
+
+
+def borrow_matrix():
+    """(CSC member x book 0/1 matrix, sorted book ids of its columns)."""
+    import numpy as np
+    from scipy import sparse
+
+    pairs = (
+        BorrowRecord.objects.order_by().values_list('user_id', 'book_id')
+        .union(BorrowRecordArchive.objects.order_by().values_list('user_id', 'book_id'))
+    )
+    pairs = np.array(list(pairs), dtype=np.int64).reshape(-1, 2)
+    _, user_index = np.unique(pairs[:, 0], return_inverse=True)
+    book_ids, book_index = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csc_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (user_index, book_index)),
+        shape=(user_index.max(initial=-1) + 1, len(book_ids)),
+    )
+    return matrix, book_ids
+
+
+def top_neighbours(matrix, columns, limit):
+    """
+    Yield (column, [(neighbour column, co-borrows, score), ...]) for columns.
+
+    co-borrows is how many members borrowed both books; score divides it by
+    the geometric mean of the two books' borrower counts (cosine similarity),
+    so bestsellers do not crowd out everything else.
+    """
+    import numpy as np
+
+    popularity = np.asarray(matrix.sum(axis=0)).ravel()
+    for start in range(0, len(columns), BLOCK_SIZE):
+        block = columns[start:start + BLOCK_SIZE]
+        counts = (matrix[:, block].T @ matrix).tocsr()
+        for row, column in enumerate(block):
+            begin, end = counts.indptr[row], counts.indptr[row + 1]
+            neighbours = counts.indices[begin:end]
+            shared = counts.data[begin:end]
+            keep = neighbours != column
+            neighbours, shared = neighbours[keep], shared[keep]
+            scores = shared / np.sqrt(popularity[column] * popularity[neighbours])
+            # Best score first; ties go to the more co-borrowed, then lower id.
+            order = np.lexsort((neighbours, -shared, -scores))[:limit]
+            yield column, [(int(neighbours[i]), int(shared[i]), float(scores[i])) for i in order]
+
+
+def refresh(full=False, limit=None):
+    """
+    Recompute stored recommendations; return how many books were refreshed.
+
+    Without full, only books affected by loans made since the last run: the
+    books borrowed and every book sharing a borrower with them.
+    """
+    import numpy as np
+
+    limit = limit or settings.LIBRARY_RECOMMENDATIONS
+    # Loans after this id are picked up by the next run.
+    last_id = BorrowRecord.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    checkpoint = JobCheckpoint.objects.filter(name=CHECKPOINT).first()
+    matrix, book_ids = borrow_matrix()
+
+    if full or checkpoint is None:
+        columns = np.arange(len(book_ids))
+    else:
+        borrowed = set(
+            BorrowRecord.objects
+            .filter(id__gt=checkpoint.position, id__lte=last_id)
+            .values_list('book_id', flat=True)
+        )
+        if not borrowed:
+            return 0
+        # A new loan changes its book's borrower count, and so the score of
+        # every book sharing a borrower with it, not just the new borrower's.
+        members = matrix[:, np.flatnonzero(np.isin(book_ids, list(borrowed)))].nonzero()[0]
+        columns = np.unique(matrix.tocsr()[np.unique(members)].nonzero()[1])
+
+    refreshed = 0
+    batch = []
+    for column, neighbours in top_neighbours(matrix, columns, limit):
+        batch.append((int(book_ids[column]), [
+            BookRecommendation(
+                book_id=int(book_ids[column]), recommended_id=int(book_ids[neighbour]),
+                rank=rank, co_borrows=shared, score=score,
+            )
+            for rank, (neighbour, shared, score) in enumerate(neighbours, 1)
+        ]))
+        if len(batch) >= BLOCK_SIZE:
+            refreshed += _save(batch)
+            batch = []
+    refreshed += _save(batch)
+
+    JobCheckpoint.objects.update_or_create(name=CHECKPOINT, defaults={'position': last_id})
+    return refreshed
+
+
+def _save(batch):
+    if not batch:
+        return 0
+    book_ids = [book_id for book_id, _ in batch]
+    with transaction.atomic():
+        BookRecommendation.objects.filter(book_id__in=book_ids).delete()
+        BookRecommendation.objects.bulk_create(
+            [recommendation for _, recommendations in batch for recommendation in recommendations],
+        )
+        # Anonymous book pages are cached with their recommendations.
+        cache.invalidate(*[cache.book_scope(book_id) for book_id in book_ids])
+    return len(batch)
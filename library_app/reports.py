@@ -0,0 +1,137 @@
+"""
+Dashboard queries and the daily loan rollups behind the librarian trends.
+
+Every function here issues a fixed number of queries regardless of how many
+loans exist: live totals come from the maintained counters in stats.py,
+a member's loans come back in one query, and trends read the small
+DailyLoanRollup table that ``manage.py rollup_loans`` materialises.  Old
+returned loans live in BorrowRecordArchive; loan_history and rollup_day
+read both tables.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from . import stats
+from .models import (
+    ACTIVE_HOLD_STATUSES, OPEN_STATUSES, BorrowRecord, BorrowRecordArchive, DailyLoanRollup, Hold,
+)
+from .pagination import paginate_union
+
+
+# Returned loans older than this drop off a member's dashboard.
+RECENT_RETURNS = timedelta(days=30)
+
+
+def librarian_stats():
+    """The librarian dashboard totals, from one counters query."""
+    counts = stats.get_counts()
+    return {
+        'total_books': counts[stats.TOTAL_BOOKS],
+        'borrowed_books': counts[stats.TOTAL_BORROWED],
+        'overdue_books': counts[stats.TOTAL_OVERDUE],
+        'total_users': counts[stats.TOTAL_USERS],
+    }
+
+
+def user_loans(user, today=None):
+    """A member's open loans and recent returns as two lists, in one query."""
+    today = today or timezone.localdate()
+    records = (
+        BorrowRecord.objects
+        .filter(user=user)
+        .filter(Q(status__in=OPEN_STATUSES) | Q(status='returned', return_date__gte=today - RECENT_RETURNS))
+        .select_related('book')
+        .only('borrow_date', 'due_date', 'return_date', 'status', 'book__title', 'book__author')
+    )
+    borrowed, returned = [], []
+    for record in records:
+        (returned if record.status == 'returned' else borrowed).append(record)
+    returned.sort(key=lambda record: record.return_date, reverse=True)
+    return borrowed, returned
+
+
+def user_holds(user):
+    """A member's waiting and ready holds, ready ones first, in one query."""
+    return list(
+        Hold.objects
+        .filter(user=user, status__in=ACTIVE_HOLD_STATUSES)
+        .select_related('book')
+        .only('status', 'created_at', 'expires_at', 'book__title', 'book__author')
+        .order_by('status', 'created_at')
+    )
+
+
+HISTORY_FIELDS = ('id', 'book_id', 'book__title', 'book__author', 'borrow_date', 'due_date', 'return_date', 'status')
+
+
+def loan_history(user, cursor=None, page_size=None):
+    """A KeysetPage of every loan user ever made, live and archived, newest first."""
+    return paginate_union(
+        [
+            BorrowRecord.objects.filter(user=user).values(*HISTORY_FIELDS),
+            BorrowRecordArchive.objects.filter(user=user).values(*HISTORY_FIELDS),
+        ],
+        ['-borrow_date', '-id'],
+        cursor,
+        page_size,
+    )
+
+
+def rollup_day(day):
+    """
+    Recompute the DailyLoanRollup rows for day; return how many were written.
+
+    A grouped query with conditional aggregation per loan table counts, per
+    category, the loans opened that day, closed that day, and gone overdue
+    that day (due the day before and not back by the end of it).
+    """
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    opened = Q(borrow_date__gte=start, borrow_date__lt=start + timedelta(days=1))
+    closed = Q(return_date=day)
+    went_overdue = Q(due_date=day - timedelta(days=1)) & (Q(return_date__isnull=True) | Q(return_date__gte=day))
+    totals = {}
+    # Old days' loans may have been archived; they count all the same.
+    for model in (BorrowRecord, BorrowRecordArchive):
+        rows = (
+            model.objects
+            .filter(opened | closed | Q(due_date=day - timedelta(days=1)))
+            .order_by()
+            .values('book__category')
+            .annotate(
+                borrowed=Count('id', filter=opened),
+                returned=Count('id', filter=closed),
+                overdue=Count('id', filter=went_overdue),
+            )
+        )
+        for row in rows:
+            total = totals.setdefault(row['book__category'], {'borrowed': 0, 'returned': 0, 'overdue': 0})
+            for key in total:
+                total[key] += row[key]
+    rollups = [DailyLoanRollup(day=day, category=category, **total) for category, total in totals.items()]
+    with transaction.atomic():
+        # Categories with no activity any more must not keep stale numbers.
+        DailyLoanRollup.objects.filter(day=day).exclude(
+            category__in=[rollup.category for rollup in rollups],
+        ).delete()
+        DailyLoanRollup.objects.bulk_create(
+            rollups,
+            update_conflicts=True,
+            unique_fields=['day', 'category'],
+            update_fields=['borrowed', 'returned', 'overdue'],
+        )
+    return len(rollups)
+
+
+def daily_trend(days=14, today=None):
+    """Library-wide totals per day for the last days days, oldest first."""
+    today = today or timezone.localdate()
+    return list(
+        DailyLoanRollup.objects
+        .filter(day__gt=today - timedelta(days=days))
+        .values('day')
+        .annotate(borrowed=Sum('borrowed'), returned=Sum('returned'), overdue=Sum('overdue'))
+        .order_by('day')
+    )
@@ -0,0 +1,88 @@
+"""
+Read-replica database routing.
+
+Reads of the catalog, loan and statistics tables are spread over the
+aliases in settings.DATABASE_REPLICAS; writes, reads inside a transaction,
+and every other model (users, sessions, admin) stay on ``default``.
+
+Replicas lag, so a client that has just borrowed or returned a book must
+not read from one: any request that writes a routed model gets a short-lived
+cookie back from ReplicaStickinessMiddleware, and requests carrying that
+cookie read from the primary.  Code outside a request can do the same with
+``use_primary()``.  Anonymous pages cached straight after a write may still
+capture replica lag, so keep the lag well below LIBRARY_PAGE_CACHE_TIMEOUT.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+REPLICATED_MODELS = {
+    'library_app.book',
+    'library_app.bookrecommendation',
+    'library_app.borrowrecord',
+    'library_app.borrowrecordarchive',
+    'library_app.librarycounter',
+    'library_app.dailyloanrollup',
+}
+
+STICKY_COOKIE = 'db_primary'
+
+
+class RoutingState:
+    """Per-request routing flags; mutated in place so ORM threads can set them."""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = ContextVar('db_routing_state', default=None)
+
+
+def begin_request(pinned):
+    """Start tracking a request; return (state, token for end_request)."""
+    state = RoutingState(pinned)
+    return state, _state.set(state)
+
+
+def end_request(token):
+    _state.reset(token)
+
+
+@contextmanager
+def use_primary():
+    """Read routed models from the primary inside this block."""
+    state, token = begin_request(pinned=True)
+    try:
+        yield state
+    finally:
+        end_request(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or model._meta.label_lower not in REPLICATED_MODELS:
+            return None
+        state = _state.get()
+        if (state is not None and state.pinned) or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.label_lower in REPLICATED_MODELS:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive their schema through replication.
+        return db not in settings.DATABASE_REPLICAS
@@ -0,0 +1,186 @@
+"""
+Catalog search.
+
+PostgreSQL keeps a weighted ``search_vector`` on every book up to date with a
+trigger and serves queries from GIN indexes (full text plus pg_trgm for typo
+tolerance).  SQLite development databases use an external-content FTS5 table
+kept in sync by triggers.  Any other backend falls back to ``icontains``.
+"""
+import re
+
+from django.contrib.postgres.lookups import TrigramWordSimilar
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db import connections
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .isbn import normalize_isbn
+
+
+POSTGRES_INSTALL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE OR REPLACE FUNCTION library_app_book_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(NEW.isbn, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW.author, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(NEW.description, '')), 'C');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS library_app_book_search_vector_trigger ON library_app_book",
+    """
+    CREATE TRIGGER library_app_book_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, author, isbn, description ON library_app_book
+    FOR EACH ROW EXECUTE FUNCTION library_app_book_search_vector_update()
+    """,
+    # Fire the trigger once for rows that predate it.
+    "UPDATE library_app_book SET title = title WHERE search_vector IS NULL",
+    "CREATE INDEX IF NOT EXISTS library_app_book_search_gin ON library_app_book USING GIN (search_vector)",
+    "CREATE INDEX IF NOT EXISTS library_app_book_title_trgm ON library_app_book USING GIN (title gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS library_app_book_author_trgm ON library_app_book USING GIN (author gin_trgm_ops)",
+]
+
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS library_app_book_author_trgm",
+    "DROP INDEX IF EXISTS library_app_book_title_trgm",
+    "DROP INDEX IF EXISTS library_app_book_search_gin",
+    "DROP TRIGGER IF EXISTS library_app_book_search_vector_trigger ON library_app_book",
+    "DROP FUNCTION IF EXISTS library_app_book_search_vector_update()",
+]
+
+# SQLite drops triggers whenever a migration rebuilds library_app_book, so
+# migrations that alter the table call install_search_index() again.
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS library_app_book_fts USING fts5(
+        title, author, isbn, description,
+        content='library_app_book', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS library_app_book_fts_ai AFTER INSERT ON library_app_book BEGIN
+        INSERT INTO library_app_book_fts(rowid, title, author, isbn, description)
+        VALUES (new.id, new.title, new.author, new.isbn, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS library_app_book_fts_ad AFTER DELETE ON library_app_book BEGIN
+        INSERT INTO library_app_book_fts(library_app_book_fts, rowid, title, author, isbn, description)
+        VALUES ('delete', old.id, old.title, old.author, old.isbn, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS library_app_book_fts_au
+    AFTER UPDATE OF title, author, isbn, description ON library_app_book BEGIN
+        INSERT INTO library_app_book_fts(library_app_book_fts, rowid, title, author, isbn, description)
+        VALUES ('delete', old.id, old.title, old.author, old.isbn, old.description);
+        INSERT INTO library_app_book_fts(rowid, title, author, isbn, description)
+        VALUES (new.id, new.title, new.author, new.isbn, new.description);
+    END
+    """,
+    "INSERT INTO library_app_book_fts(library_app_book_fts) VALUES ('rebuild')",
+]
+
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS library_app_book_fts_au",
+    "DROP TRIGGER IF EXISTS library_app_book_fts_ad",
+    "DROP TRIGGER IF EXISTS library_app_book_fts_ai",
+    "DROP TABLE IF EXISTS library_app_book_fts",
+]
+
+INSTALL = {'postgresql': POSTGRES_INSTALL, 'sqlite': SQLITE_INSTALL}
+UNINSTALL = {'postgresql': POSTGRES_UNINSTALL, 'sqlite': SQLITE_UNINSTALL}
+
+# How much title word_similarity() adds to ts_rank on PostgreSQL, so close
+# typo matches still sort above weak full-text hits.
+TRIGRAM_WEIGHT = 0.5
+
+
+def install_search_index(apps, schema_editor):
+    """Migration hook: create the search trigger/index for this backend."""
+    for sql in INSTALL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def uninstall_search_index(apps, schema_editor):
+    """Migration hook: drop everything install_search_index() created."""
+    for sql in UNINSTALL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def normalize_isbn_query(query):
+    """Return query as an ISBN-13 if it is a valid ISBN, else ''."""
+    try:
+        return normalize_isbn(query)
+    except ValueError:
+        return ''
+
+
+def _fts5_expression(query):
+    # Quote every token so user input can never be parsed as FTS5 syntax and
+    # make each one a prefix match, which also covers partially typed words.
+    tokens = re.findall(r'\w+', query)
+    return ' '.join('"%s"*' % token for token in tokens)
+
+
+def search_books(queryset, query):
+    """
+    Filter a Book queryset down to matches for query.
+
+    The result is annotated with ``search_rank`` (higher is better); callers
+    decide the ordering.
+    """
+    query = query.strip()
+    if not query:
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    vendor = connections[queryset.db].vendor
+    isbn = normalize_isbn_query(query)
+    isbn_match = Q(isbn=isbn) if isbn else Q(pk__in=[])
+
+    if vendor == 'postgresql':
+        search_query = SearchQuery(query, search_type='websearch', config='english')
+        return queryset.annotate(
+            search_rank=SearchRank(F('search_vector'), search_query)
+            + TRIGRAM_WEIGHT * TrigramWordSimilarity(query, 'title'),
+        ).filter(
+            Q(search_vector=search_query)
+            | Q(TrigramWordSimilar(F('title'), Value(query)))
+            | Q(TrigramWordSimilar(F('author'), Value(query)))
+            | isbn_match
+        )
+
+    if vendor == 'sqlite':
+        # An ISBN query looks for the normalised ISBN-13 the catalog stores.
+        expression = _fts5_expression(isbn or query)
+        if not expression:
+            # Punctuation only: nothing to match, but keep the annotation.
+            return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+        table = queryset.model._meta.db_table
+        # Joined rather than filtered with a subquery: bm25() is only cheap
+        # when evaluated on the rows of the MATCH itself.
+        return queryset.extra(
+            tables=['library_app_book_fts'],
+            where=[
+                'library_app_book_fts.rowid = "%s"."id"' % table,
+                'library_app_book_fts MATCH %s',
+            ],
+            params=[expression],
+        ).annotate(
+            # bm25() is negative, lower is better; column weights favour title/ISBN.
+            search_rank=RawSQL(
+                '-bm25(library_app_book_fts, 10.0, 5.0, 10.0, 1.0)', (), output_field=FloatField(),
+            ),
+        )
+
+    return queryset.filter(
+        Q(title__icontains=query)
+        | Q(author__icontains=query)
+        | Q(description__icontains=query)
+        | isbn_match
+    ).annotate(search_rank=Value(0.0, output_field=FloatField()))
@@ -0,0 +1,265 @@
+"""
+Borrow, return and hold operations.
+
+Inventory is changed with single conditional UPDATE statements inside a
+transaction, so concurrent borrows of the same title can never oversell it
+and no Book row is read into Python first.  Views and the admin go through
+these functions rather than editing available_copies themselves.
+
+A returned copy of a book with a hold queue is set aside for the oldest
+waiting hold instead of going back on the shelf.  The queue head is picked
+with SELECT ... FOR UPDATE SKIP LOCKED, so simultaneous returns of the same
+title claim different holds without waiting on each other, and a return
+costs the same few queries however long the queue is.
+"""
+from collections import Counter
+
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, transaction
+from django.db.models import F
+from django.db.models.functions import Least
+from django.utils import timezone
+
+from . import cache, events, stats
+from .models import HOLD_PICKUP_PERIOD, LOAN_PERIOD, Book, BorrowRecord, BorrowRecordArchive, Hold, LoanNotice
+
+
+class BorrowError(Exception):
+    """Base class for borrow/return failures."""
+
+
+class BookUnavailable(BorrowError):
+    """No copy of the book is left (or the book does not exist)."""
+
+
+class NotBorrowed(BorrowError):
+    """The loan has already been returned."""
+
+
+class HoldNotNeeded(BorrowError):
+    """A copy is on the shelf; borrow it instead of queueing."""
+
+
+class AlreadyHeld(BorrowError):
+    """The member already has an active hold on the book."""
+
+
+def take_copy(book_id):
+    """Decrement available_copies if a copy is left, else raise BookUnavailable."""
+    books = Book.objects.filter(pk=book_id)
+    cache.invalidate_availability(book_id)
+    now = timezone.now()
+    # The common case is one statement; the last copy gets its own statement
+    # so the "available books" counter learns the title just ran out.
+    if books.filter(available_copies__gt=1).update(available_copies=F('available_copies') - 1, updated_at=now):
+        return
+    if books.filter(available_copies=1).update(available_copies=0, updated_at=now):
+        stats.adjust(available_books=-1)
+        return
+    raise BookUnavailable(book_id)
+
+
+def return_copy(book_id, count=1):
+    """Put count copies back on the shelf, never past total_copies."""
+    books = Book.objects.filter(pk=book_id)
+    cache.invalidate_availability(book_id)
+    now = timezone.now()
+    # Least() caps the shelf at total_copies instead of skipping the UPDATE,
+    # so a shelf with room for fewer than count still takes what fits.
+    if books.filter(available_copies=0, total_copies__gt=0).update(
+        available_copies=Least(count, F('total_copies')), updated_at=now,
+    ):
+        stats.adjust(available_books=1)
+        return
+    books.filter(available_copies__lt=F('total_copies')).update(
+        available_copies=Least(F('available_copies') + count, F('total_copies')), updated_at=now,
+    )
+
+
+def release_copies(book_id, count=1, now=None):
+    """
+    Hand count freed copies to the oldest waiting holds; shelve the rest.
+
+    Must run inside a transaction.  Returns the holds made ready.
+    """
+    now = now or timezone.now()
+    hold_ids = list(
+        Hold.objects
+        .filter(book_id=book_id, status='waiting')
+        .order_by('created_at', 'id')
+        .select_for_update(skip_locked=True)
+        .values_list('id', flat=True)[:count]
+    )
+    if hold_ids:
+        Hold.objects.filter(pk__in=hold_ids).update(
+            status='ready', ready_at=now, expires_at=now + HOLD_PICKUP_PERIOD,
+        )
+    if count > len(hold_ids):
+        return_copy(book_id, count - len(hold_ids))
+    return hold_ids
+
+
+def claim_hold(user, book_id):
+    """Mark user's ready hold on the book fulfilled; False if there is none."""
+    return bool(
+        Hold.objects.filter(user=user, book_id=book_id, status='ready').update(status='fulfilled')
+    )
+
+
+def borrow_book(user, book_id):
+    """Lend one copy of the book to user and return the new BorrowRecord."""
+    with transaction.atomic():
+        # A ready hold's copy was set aside for this member, off the shelf.
+        if not claim_hold(user, book_id):
+            take_copy(book_id)
+        stats.adjust(total_borrowed=1)
+        record = BorrowRecord.objects.create(
+            user=user,
+            book_id=book_id,
+            due_date=timezone.localdate() + LOAN_PERIOD,
+        )
+        events.emit('borrowed', user_id=user.pk, book_id=book_id, loan_id=record.pk)
+        return record
+
+
+def return_book(record):
+    """Close an open loan and put its copy back on the shelf."""
+    today = timezone.localdate()
+    with transaction.atomic():
+        # The status conditions make a double return (two tabs, a retried
+        # request) a no-op instead of a second increment.
+        loan = BorrowRecord.objects.filter(pk=record.pk)
+        if loan.filter(status='borrowed').update(status='returned', return_date=today):
+            stats.adjust(total_borrowed=-1)
+        elif loan.filter(status='overdue').update(status='returned', return_date=today):
+            stats.adjust(total_borrowed=-1, total_overdue=-1)
+        else:
+            raise NotBorrowed(record.pk)
+        release_copies(record.book_id)
+        events.emit('returned', user_id=record.user_id, book_id=record.book_id, loan_id=record.pk)
+    record.status = 'returned'
+    record.return_date = today
+    return record
+
+
+def place_hold(user, book_id):
+    """
+    Queue user for the book and return the Hold.
+
+    Raises HoldNotNeeded while a copy is on the shelf, AlreadyHeld if the
+    member is already queued (or has a copy waiting), and Book.DoesNotExist
+    for an unknown book.
+    """
+    # From the primary: a replica may not have seen the borrow of the last copy.
+    if Book.objects.using(DEFAULT_DB_ALIAS).filter(pk=book_id, available_copies__gt=0).exists():
+        raise HoldNotNeeded(book_id)
+    try:
+        with transaction.atomic():
+            return Hold.objects.create(user=user, book=Book.objects.only('id').get(pk=book_id))
+    except IntegrityError:
+        raise AlreadyHeld(book_id)
+
+
+def queue_position(hold):
+    """1 for the hold at the head of its book's queue (an indexed count)."""
+    return Hold.objects.filter(
+        book_id=hold.book_id, status='waiting', created_at__lte=hold.created_at,
+    ).exclude(created_at=hold.created_at, id__gt=hold.id).count()
+
+
+def cancel_hold(hold):
+    """Withdraw a hold; a copy already set aside passes to the next in line."""
+    with transaction.atomic():
+        holds = Hold.objects.filter(pk=hold.pk)
+        if holds.filter(status='waiting').update(status='cancelled'):
+            return
+        if holds.filter(status='ready').update(status='cancelled'):
+            release_copies(hold.book_id)
+
+
+def expire_holds(now=None, chunk_size=1000):
+    """
+    Expire ready holds nobody collected in time; return how many.
+
+    Each chunk locks its holds (skipping any a borrow is claiming right now),
+    expires them with one UPDATE and passes the copies on per book.
+    """
+    now = now or timezone.now()
+    expired = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Hold.objects
+                .filter(status='ready', expires_at__lt=now)
+                .order_by()
+                .select_for_update(skip_locked=True)
+                .values_list('id', 'book_id')[:chunk_size]
+            )
+            if not rows:
+                return expired
+            Hold.objects.filter(pk__in=[hold_id for hold_id, _ in rows]).update(status='expired')
+            for book_id, count in Counter(book_id for _, book_id in rows).items():
+                release_copies(book_id, count, now)
+        expired += len(rows)
+
+
+def mark_overdue(today=None, chunk_size=1000):
+    """
+    Flip every borrowed loan past its due date to 'overdue'; return how many.
+
+    Works in short chunks (one indexed SELECT of ids, one UPDATE) so row locks
+    are held briefly and borrow/return traffic is never blocked for long.
+    The status guard on the UPDATE leaves alone any loan returned since the
+    SELECT, and running it again finds nothing left to do.
+    """
+    today = today or timezone.localdate()
+    pending = BorrowRecord.objects.filter(status='borrowed', due_date__lt=today).order_by()
+    flipped = 0
+    while True:
+        ids = list(pending.values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return flipped
+        with transaction.atomic():
+            count = BorrowRecord.objects.filter(pk__in=ids, status='borrowed').update(status='overdue')
+            stats.adjust(total_overdue=count)
+        flipped += count
+
+
+ARCHIVED_FIELDS = ('id', 'user_id', 'book_id', 'borrow_date', 'due_date', 'return_date', 'status')
+
+
+def archive_loans(returned_before, chunk_size=5000):
+    """
+    Move loans returned before the given date into BorrowRecordArchive.
+
+    A generator yielding how many loans each chunk moved.  Every chunk is
+    its own transaction (copy, then delete the originals), so stopping at
+    any point loses nothing and the next run carries on where this one
+    stopped; archived rows keep their ids, so a chunk copied twice is
+    ignored rather than duplicated.
+    """
+    table = connection.ops.quote_name(BorrowRecord._meta.db_table)
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                BorrowRecord.objects
+                .filter(status='returned', return_date__lt=returned_before, id__gt=last_id)
+                .order_by('id')
+                .values(*ARCHIVED_FIELDS)[:chunk_size]
+            )
+            if not rows:
+                return
+            BorrowRecordArchive.objects.bulk_create(
+                [BorrowRecordArchive(**row) for row in rows], ignore_conflicts=True,
+            )
+            ids = [row['id'] for row in rows]
+            # A plain DELETE: QuerySet.delete() would load every row to send
+            # post_delete signals, and closed loans need no cache invalidation.
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {table} WHERE status = 'returned' AND id IN ({', '.join(['%s'] * len(ids))})",
+                    ids,
+                )
+            LoanNotice.objects.filter(loan_id__in=ids).delete()
+        last_id = ids[-1]
+        yield len(ids)
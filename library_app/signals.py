@@ -0,0 +1,51 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import cache, events, stats
+from .backends import invalidate_user
+from .models import Book, BorrowRecord, UserProfile
+
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, created, **kwargs):
+    cache.invalidate_book(instance.pk)
+    if created:
+        stats.adjust(total_books=1, available_books=int(instance.available_copies > 0))
+        events.emit('book_added', book_id=instance.pk)
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    cache.invalidate_book(instance.pk)
+    stats.adjust(total_books=-1, available_books=-int(instance.available_copies > 0))
+
+
+@receiver(post_save, sender=BorrowRecord)
+@receiver(post_delete, sender=BorrowRecord)
+def borrow_record_changed(sender, instance, **kwargs):
+    cache.invalidate_availability(instance.book_id)
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, **kwargs):
+    if created:
+        stats.adjust(total_users=1)
+        events.emit('member_joined', user_id=instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    stats.adjust(total_users=-1)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def user_profile_changed(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
@@ -0,0 +1,105 @@
+"""
+Library-wide statistics.
+
+The totals shown on the homepage and librarian dashboard live in the
+LibraryCounter table and are adjusted in the same transaction as the change
+that moves them, so a page view sums a few dozen small rows instead of
+counting whole tables.  Each counter is split over SHARDS rows and every
+adjustment picks one at random, so concurrent borrows and returns rarely
+wait on each other's counter row locks; reads sum the shards.
+``manage.py reconcile_stats`` recounts from scratch to repair any drift
+(bulk imports, admin deletes, raw SQL).
+"""
+import random
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, Sum
+
+from . import cache
+from .models import OPEN_STATUSES, Book, BorrowRecord, LibraryCounter
+
+
+TOTAL_BOOKS = 'total_books'
+AVAILABLE_BOOKS = 'available_books'
+TOTAL_USERS = 'total_users'
+TOTAL_BORROWED = 'total_borrowed'
+TOTAL_OVERDUE = 'total_overdue'
+
+COUNTERS = (TOTAL_BOOKS, AVAILABLE_BOOKS, TOTAL_USERS, TOTAL_BORROWED, TOTAL_OVERDUE)
+
+# Rows per counter.  More shards mean less lock contention between writers
+# and a little more to sum per read; changing it needs no migration.
+SHARDS = 16
+
+
+def adjust(**deltas):
+    """Add each delta to its counter, e.g. ``adjust(total_books=1)``."""
+    changed = False
+    shard = random.randrange(SHARDS)
+    for name, delta in deltas.items():
+        if delta:
+            rows = LibraryCounter.objects.filter(name=name, shard=shard)
+            if not rows.update(value=F('value') + delta):
+                LibraryCounter.objects.bulk_create([LibraryCounter(name=name, shard=shard)], ignore_conflicts=True)
+                rows.update(value=F('value') + delta)
+            changed = True
+    if changed:
+        cache.invalidate(cache.STATS)
+
+
+def _totals():
+    return (
+        LibraryCounter.objects.filter(name__in=COUNTERS)
+        .values('name').annotate(total=Sum('value')).order_by().values_list('name', 'total')
+    )
+
+
+def get_counts():
+    """All counters as a dict, in one query."""
+    counts = dict.fromkeys(COUNTERS, 0)
+    counts.update(_totals())
+    return counts
+
+
+async def aget_counts():
+    counts = dict.fromkeys(COUNTERS, 0)
+    async for name, total in _totals():
+        counts[name] = total
+    return counts
+
+
+def compute_counts():
+    """The counters' true values, counted from the source tables."""
+    return {
+        TOTAL_BOOKS: Book.objects.count(),
+        AVAILABLE_BOOKS: Book.objects.filter(available_copies__gt=0).count(),
+        TOTAL_USERS: User.objects.count(),
+        TOTAL_BORROWED: BorrowRecord.objects.filter(status__in=OPEN_STATUSES).count(),
+        TOTAL_OVERDUE: BorrowRecord.objects.filter(status='overdue').count(),
+    }
+
+
+def reconcile():
+    """
+    Overwrite every counter with its true value.
+
+    Returns {name: drift} for counters that were wrong.  The counter rows are
+    locked before counting, so a borrow that commits meanwhile waits and then
+    applies its delta on top of the recount instead of being lost.
+    """
+    with transaction.atomic():
+        stored = {}
+        for name, value in LibraryCounter.objects.select_for_update().values_list('name', 'value'):
+            stored[name] = stored.get(name, 0) + value
+        actual = compute_counts()
+        # The whole total goes in shard 0 and the other shards restart at zero.
+        LibraryCounter.objects.filter(name__in=COUNTERS, shard__gt=0).update(value=0)
+        for name, value in actual.items():
+            LibraryCounter.objects.update_or_create(name=name, shard=0, defaults={'value': value})
+        cache.invalidate(cache.STATS)
+    return {
+        name: value - stored.get(name, 0)
+        for name, value in actual.items()
+        if value != stored.get(name)
+    }
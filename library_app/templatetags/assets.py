@@ -0,0 +1,32 @@
+import functools
+
+from django import template
+from django.contrib.staticfiles import finders
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from library_app.assets import VENDOR
+
+register = template.Library()
+
+
+@functools.lru_cache
+def _vendored(path):
+    return finders.find(path) is not None
+
+
+@register.simple_tag
+def vendor_asset(name):
+    """
+    A <link> or <script> tag for a VENDOR asset: the local copy once
+    ``manage.py vendor_assets`` has fetched it, else the CDN copy with its
+    integrity hash.
+    """
+    url, path, integrity = VENDOR[name]
+    if _vendored(path):
+        url, attributes = static(path), ''
+    else:
+        attributes = format_html(' integrity="{}" crossorigin="anonymous"', integrity)
+    if name.endswith('.css'):
+        return format_html('<link href="{}" rel="stylesheet"{}>', url, attributes)
+    return format_html('<script src="{}"{}></script>', url, attributes)
@@ -0,0 +1,22 @@
+"""Test helpers for asserting the query budgets declared with @query_budget."""
+from django.urls import resolve
+
+from .querybudget import QueryTracker
+
+
+class QueryBudgetMixin:
+    """Mix into a django.test.TestCase to check views against their budgets."""
+
+    def assertWithinQueryBudget(self, url, method='get', client=None, **kwargs):
+        """Request url and fail if its view ran more queries than it declared."""
+        budget = getattr(resolve(url.split('?')[0]).func, 'query_budget', None)
+        if budget is None:
+            self.fail(f'The view for {url} has no @query_budget.')
+        with QueryTracker() as tracker:
+            response = getattr(client or self.client, method)(url, **kwargs)
+        self.assertLessEqual(
+            tracker.count, budget,
+            f'{url} ran {tracker.count} queries (budget {budget}):\n'
+            + '\n'.join(sql for sql, _ in tracker.queries),
+        )
+        return response
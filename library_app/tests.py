@@ -1,3 +1,813 @@
-from django.test import TestCase
+import io
+import json
+import os
+import pickle
+import tempfile
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.mail.backends.locmem import EmailBackend
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import events, facets, notices, recommendations, reports, routers, services, stats
+from .backends import CachedModelBackend, _user_key
+from .cache import CATALOG, book_scope, get_generations
+from .models import (
+    Book, BookRecommendation, BorrowRecord, BorrowRecordArchive, DailyLoanRollup, Hold, JobCheckpoint, LibraryEvent,
+    LoanNotice, UserProfile,
+)
+from .search import search_books
+from .testing import QueryBudgetMixin
+
+
+def make_book(number, **fields):
+    fields = {
+        'title': f'Book {number}',
+        'author': f'Author {number}',
+        'isbn': f'978{number:010d}',
+        'category': 'fiction',
+        'total_copies': 2,
+        'available_copies': 2,
+        'publication_date': date(2000, 1, 1),
+        **fields,
+    }
+    return Book.objects.create(**fields)
+
+
+def make_member(username, **profile):
+    user = User.objects.create_user(username=username, email=f'{username}@example.com', password='x')
+    UserProfile.objects.create(user=user, library_card_number=f'LC-{username}', **profile)
+    return user
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Each view stays within its @query_budget, cold cache included."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = [make_book(number) for number in range(30)]
+        cls.member = make_member('member')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_index(self):
+        self.assertWithinQueryBudget(reverse('index'))
+        self.client.force_login(self.member)
+        self.assertWithinQueryBudget(reverse('index'))
+
+    def test_book_list(self):
+        self.assertWithinQueryBudget(reverse('book_list'))
+        self.assertWithinQueryBudget(reverse('book_list') + '?search=Book&category=fiction')
+        self.client.force_login(self.member)
+        self.assertWithinQueryBudget(reverse('book_list'))
+
+    def test_book_detail(self):
+        self.assertWithinQueryBudget(reverse('book_detail', args=[self.books[0].pk]))
+        self.client.force_login(self.member)
+        self.assertWithinQueryBudget(reverse('book_detail', args=[self.books[0].pk]))
+
+    def test_borrow_and_return(self):
+        self.client.force_login(self.member)
+        book = self.books[0]
+        response = self.assertWithinQueryBudget(reverse('borrow_book', args=[book.pk]), method='post')
+        self.assertRedirects(response, reverse('book_list'), fetch_redirect_response=False)
+        record = BorrowRecord.objects.get(user=self.member, book=book)
+        self.assertWithinQueryBudget(reverse('return_book', args=[record.pk]), method='post')
+        record.refresh_from_db()
+        self.assertEqual(record.status, 'returned')
+
+
+class BorrowServiceTests(TestCase):
+    """Inventory moves through conditional UPDATEs that can never oversell."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = make_book(1, total_copies=1, available_copies=1)
+        cls.members = [make_member(f'member{number}') for number in range(3)]
+
+    def test_last_copy_cannot_be_borrowed_twice(self):
+        first, second, _ = self.members
+        services.borrow_book(first, self.book.pk)
+        with self.assertRaises(services.BookUnavailable):
+            services.borrow_book(second, self.book.pk)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+        self.assertEqual(BorrowRecord.objects.filter(book=self.book).count(), 1)
+
+    def test_failed_borrow_changes_nothing(self):
+        before = stats.get_counts()
+        services.borrow_book(self.members[0], self.book.pk)
+        for member in self.members[1:]:
+            with self.assertRaises(services.BookUnavailable):
+                services.borrow_book(member, self.book.pk)
+        after = stats.get_counts()
+        self.assertEqual(after[stats.TOTAL_BORROWED] - before[stats.TOTAL_BORROWED], 1)
+        self.assertEqual(after[stats.AVAILABLE_BOOKS] - before[stats.AVAILABLE_BOOKS], -1)
+
+    def test_return_puts_the_copy_back_once(self):
+        record = services.borrow_book(self.members[0], self.book.pk)
+        services.return_book(record)
+        with self.assertRaises(services.NotBorrowed):
+            services.return_book(record)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+        services.borrow_book(self.members[1], self.book.pk)
+
+    def test_unknown_book_is_unavailable(self):
+        with self.assertRaises(services.BookUnavailable):
+            services.borrow_book(self.members[0], 0)
+
+    def test_borrow_needs_post(self):
+        self.client.force_login(self.members[0])
+        response = self.client.get(reverse('borrow_book', args=[self.book.pk]))
+        self.assertEqual(response.status_code, 405)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+
+
+class HoldQueueTests(TestCase):
+    """Returned copies go to the oldest waiting hold, one each."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = make_book(1, total_copies=1, available_copies=1)
+        cls.borrower = make_member('borrower')
+        cls.members = [make_member(f'member{number}') for number in range(3)]
+
+    def setUp(self):
+        self.loan = services.borrow_book(self.borrower, self.book.pk)
+
+    def queue(self):
+        return [services.place_hold(member, self.book.pk) for member in self.members]
+
+    def test_no_hold_while_a_copy_is_on_the_shelf(self):
+        services.return_book(self.loan)
+        with self.assertRaises(services.HoldNotNeeded):
+            services.place_hold(self.members[0], self.book.pk)
+
+    def test_one_active_hold_per_member(self):
+        services.place_hold(self.members[0], self.book.pk)
+        with self.assertRaises(services.AlreadyHeld):
+            services.place_hold(self.members[0], self.book.pk)
+
+    def test_queue_is_served_oldest_first(self):
+        holds = self.queue()
+        self.assertEqual([services.queue_position(hold) for hold in holds], [1, 2, 3])
+        services.return_book(self.loan)
+        statuses = dict(Hold.objects.values_list('pk', 'status'))
+        self.assertEqual([statuses[hold.pk] for hold in holds], ['ready', 'waiting', 'waiting'])
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+        self.assertEqual(services.queue_position(holds[1]), 1)
+
+    def test_ready_hold_is_claimed_by_borrowing(self):
+        holds = self.queue()
+        services.return_book(self.loan)
+        services.borrow_book(self.members[0], self.book.pk)
+        self.assertEqual(Hold.objects.get(pk=holds[0].pk).status, 'fulfilled')
+        with self.assertRaises(services.BookUnavailable):
+            services.borrow_book(self.members[1], self.book.pk)
+
+    def test_cancelled_ready_hold_passes_the_copy_on(self):
+        holds = self.queue()
+        services.return_book(self.loan)
+        services.cancel_hold(Hold.objects.get(pk=holds[0].pk))
+        self.assertEqual(Hold.objects.get(pk=holds[1].pk).status, 'ready')
+
+    def test_expired_holds_pass_the_copy_on_then_shelve_it(self):
+        first, second = [services.place_hold(member, self.book.pk) for member in self.members[:2]]
+        services.return_book(self.loan)
+        later = timezone.now() + timedelta(days=30)
+        self.assertEqual(services.expire_holds(now=later), 1)
+        self.assertEqual(Hold.objects.get(pk=first.pk).status, 'expired')
+        self.assertEqual(Hold.objects.get(pk=second.pk).status, 'ready')
+        self.assertEqual(services.expire_holds(now=later + timedelta(days=30)), 1)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+
+    def test_return_copy_never_exceeds_total(self):
+        book = make_book(2, total_copies=3, available_copies=2)
+        services.return_copy(book.pk, count=5)
+        book.refresh_from_db()
+        self.assertEqual(book.available_copies, 3)
+
+    def test_hold_views_need_post_and_a_csrf_token(self):
+        client = self.client_class(enforce_csrf_checks=True)
+        client.force_login(self.members[0])
+        self.assertEqual(client.get(reverse('place_hold', args=[self.book.pk])).status_code, 405)
+        self.assertEqual(client.post(reverse('place_hold', args=[self.book.pk])).status_code, 403)
+        # Catalog cards are cached for every member; each gets its own token.
+        page = client.get(reverse('book_list')).content.decode()
+        self.assertNotIn('<!-- csrf_token -->', page)
+        token = page.split('name="csrfmiddlewaretoken" value="')[1].split('"')[0]
+        response = client.post(reverse('place_hold', args=[self.book.pk]), {'csrfmiddlewaretoken': token})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Hold.objects.filter(user=self.members[0], status='waiting').exists())
+
+
+class LoanArchiveTests(TestCase):
+    """Archived loans keep their ids and page together with live ones."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = make_member('member')
+        other = make_member('other')
+        book = make_book(1, total_copies=20, available_copies=20)
+        now = timezone.now()
+        for number in range(9):
+            record = BorrowRecord.objects.create(user=cls.member, book=book, due_date=date(2020, 1, 15))
+            # Pairs of loans share a borrow_date, so pages must break ties on id.
+            returned = number % 3 != 0
+            BorrowRecord.objects.filter(pk=record.pk).update(
+                borrow_date=now - timedelta(days=number // 2),
+                status='returned' if returned else 'borrowed',
+                return_date=date(2020, 1, 10) if returned else None,
+            )
+        BorrowRecord.objects.create(user=other, book=book, due_date=date(2020, 1, 15))
+
+    def expected(self):
+        return list(
+            BorrowRecord.objects.filter(user=self.member)
+            .order_by('-borrow_date', '-id').values_list('id', flat=True)
+        )
+
+    def walk(self, page_size):
+        ids, pages, cursor = [], [], None
+        while True:
+            page = reports.loan_history(self.member, cursor, page_size)
+            pages.append(page)
+            ids.extend(row['id'] for row in page)
+            if not page.has_next():
+                return ids, pages
+            cursor = page.next_cursor
+
+    def test_archive_moves_returned_loans_and_keeps_ids(self):
+        expected = self.expected()
+        moved = sum(services.archive_loans(date(2020, 2, 1), chunk_size=2))
+        self.assertEqual(moved, 6)
+        self.assertEqual(BorrowRecord.objects.filter(user=self.member).count(), 3)
+        self.assertEqual(
+            sorted(expected),
+            sorted([*BorrowRecord.objects.filter(user=self.member).values_list('id', flat=True),
+                    *BorrowRecordArchive.objects.filter(user=self.member).values_list('id', flat=True)]),
+        )
+        self.assertEqual(sum(services.archive_loans(date(2020, 2, 1))), 0)
+
+    def test_history_pages_across_live_and_archived_loans(self):
+        expected = self.expected()
+        list(services.archive_loans(date(2020, 2, 1)))
+        for page_size in (1, 2, 4, 20):
+            with self.subTest(page_size=page_size):
+                ids, pages = self.walk(page_size)
+                self.assertEqual(ids, expected)
+                self.assertTrue(all(len(page) <= page_size for page in pages))
+
+    def test_history_pages_backwards(self):
+        expected = self.expected()
+        list(services.archive_loans(date(2020, 2, 1)))
+        _, pages = self.walk(2)
+        page, ids = pages[-1], []
+        while True:
+            ids[:0] = [row['id'] for row in page]
+            if not page.has_previous():
+                break
+            page = reports.loan_history(self.member, page.previous_cursor, 2)
+        self.assertEqual(ids, expected)
+
+
+class CountingEmailBackend(EmailBackend):
+    calls = 0
+
+    def send_messages(self, messages):
+        type(self).calls += 1
+        return super().send_messages(messages)
+
+
+class FailingEmailBackend(EmailBackend):
+    def send_messages(self, messages):
+        raise OSError('SMTP server went away')
+
+
+class LoanNoticeTests(TestCase):
+    """Reminders go out once per loan and due date, batched per member."""
+
+    TODAY = date(2024, 3, 10)
+
+    @classmethod
+    def setUpTestData(cls):
+        book = make_book(1, total_copies=50, available_copies=50)
+        cls.members = [make_member(f'member{number}') for number in range(3)]
+        cls.loans = {}
+        for member in cls.members:
+            cls.loans[member.username] = [
+                BorrowRecord.objects.create(user=member, book=book, due_date=cls.TODAY + timedelta(days=2)),
+                BorrowRecord.objects.create(user=member, book=book, due_date=cls.TODAY - timedelta(days=1)),
+                BorrowRecord.objects.create(user=member, book=book, due_date=cls.TODAY - timedelta(days=5),
+                                            status='overdue'),
+                # Neither due soon nor overdue.
+                BorrowRecord.objects.create(user=member, book=book, due_date=cls.TODAY + timedelta(days=7)),
+                BorrowRecord.objects.create(user=member, book=book, due_date=cls.TODAY - timedelta(days=3),
+                                            status='returned'),
+            ]
+        no_email = make_member('no_email')
+        User.objects.filter(pk=no_email.pk).update(email='')
+        BorrowRecord.objects.create(user=no_email, book=book, due_date=cls.TODAY, status='overdue')
+
+    def send(self, **kwargs):
+        kwargs.setdefault('connection', EmailBackend())
+        return list(notices.send(today=self.TODAY, days=2, **kwargs))
+
+    def test_pending_finds_due_soon_and_overdue_loans(self):
+        pending = list(notices.pending(self.TODAY, 2))
+        self.assertEqual(len(pending), 9)
+        self.assertEqual({row['user_id'] for row in pending}, {member.pk for member in self.members})
+        kinds = {row['id']: row['kind'] for row in pending}
+        first = self.loans['member0']
+        self.assertEqual([kinds.get(loan.pk) for loan in first], ['due_soon', 'overdue', 'overdue', None, None])
+
+    def test_one_email_per_member_and_never_twice(self):
+        self.assertEqual(self.send(), [(3, 9)])
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         [f'{member.username}@example.com' for member in self.members])
+        self.assertIn(self.loans['member0'][0].book.title, mail.outbox[0].body)
+        self.assertEqual(LoanNotice.objects.count(), 9)
+        self.assertEqual(self.send(), [])
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_each_batch_is_one_send_messages_call(self):
+        CountingEmailBackend.calls = 0
+        self.assertEqual(self.send(batch_size=2, connection=CountingEmailBackend()), [(2, 6), (1, 3)])
+        self.assertEqual(CountingEmailBackend.calls, 2)
+
+    def test_notices_recorded_concurrently_skip_only_their_member(self):
+        batch = [[row for row in notices.pending(self.TODAY, 2) if row['user_id'] == member.pk]
+                 for member in self.members]
+        taken = batch[0][0]
+        LoanNotice.objects.create(loan_id=taken['id'], user_id=taken['user_id'], kind=taken['kind'],
+                                  due_date=taken['due_date'])
+        claimed = notices.claim(batch)
+        self.assertEqual([len(loans) for loans in claimed], [2, 3, 3])
+        self.assertNotIn(taken['id'], [loan['id'] for loans in claimed for loan in loans])
+
+    def test_failed_batch_is_not_resent(self):
+        with self.assertRaises(OSError):
+            self.send(connection=FailingEmailBackend())
+        self.assertEqual(LoanNotice.objects.count(), 9)
+        self.assertEqual(self.send(), [])
+
+    def test_moved_due_date_is_reminded_again(self):
+        self.send()
+        loan = self.loans['member1'][0]
+        BorrowRecord.objects.filter(pk=loan.pk).update(due_date=self.TODAY - timedelta(days=2))
+        self.assertEqual(self.send(), [(1, 1)])
+
+
+class LibraryEventTests(TestCase):
+    """The outbox records committed changes; consumers see each event once, in order."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = make_book(1)
+        cls.member = make_member('member')
+
+    def setUp(self):
+        self.seen = []
+        events.CONSUMERS['test'] = lambda batch: self.seen.append([event.pk for event in batch])
+        self.addCleanup(events.CONSUMERS.pop, 'test')
+
+    def later(self):
+        return timezone.now() + timedelta(hours=1)
+
+    def test_changes_are_recorded_with_their_transaction(self):
+        LibraryEvent.objects.all().delete()
+        record = services.borrow_book(self.member, self.book.pk)
+        services.return_book(record)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            services.borrow_book(self.member, self.book.pk)
+            raise RuntimeError
+        self.client.post(reverse('registration'), {
+            'username': 'newcomer', 'email': 'new@example.com', 'password': 'pw', 'confirm_password': 'pw',
+        })
+        make_book(2)
+        self.assertEqual(
+            list(LibraryEvent.objects.values_list('kind', 'loan_id')),
+            [('borrowed', record.pk), ('returned', record.pk), ('member_joined', None), ('book_added', None)],
+        )
+
+    def test_batches_arrive_in_order_and_are_checkpointed(self):
+        for _ in range(5):
+            events.emit('borrowed', user_id=self.member.pk)
+        ids = list(LibraryEvent.objects.order_by('pk').values_list('pk', flat=True))
+        self.assertEqual(sum(events.consume('test', batch_size=2, now=self.later())), len(ids))
+        self.assertEqual([pk for batch in self.seen for pk in batch], ids)
+        self.assertTrue(all(len(batch) <= 2 for batch in self.seen))
+        self.assertEqual(JobCheckpoint.objects.get(name='events:test').position, ids[-1])
+        self.assertEqual(list(events.consume('test', now=self.later())), [])
+        event = events.emit('returned', user_id=self.member.pk)
+        self.assertEqual(list(events.consume('test', now=self.later())), [1])
+        self.assertEqual(self.seen[-1], [event.pk])
+
+    def test_failed_batch_is_redelivered(self):
+        first = events.emit('borrowed')
+
+        def fail(batch):
+            raise ValueError
+
+        events.CONSUMERS['test'] = fail
+        with self.assertRaises(ValueError):
+            list(events.consume('test', now=self.later()))
+        events.CONSUMERS['test'] = lambda batch: self.seen.append([event.pk for event in batch])
+        list(events.consume('test', now=self.later()))
+        self.assertIn(first.pk, self.seen[0])
+
+    def test_waits_at_a_fresh_gap_until_it_settles(self):
+        list(events.consume('test', now=self.later()))
+        last = LibraryEvent.objects.order_by('-pk').first()
+        position = last.pk if last else 0
+        # An id skipped by a transaction that may still commit.
+        after_gap = LibraryEvent.objects.create(pk=position + 2, kind='borrowed')
+        self.assertEqual(list(events.consume('test')), [])
+        self.assertEqual(list(events.consume('test', now=self.later())), [1])
+        self.assertEqual(self.seen[-1], [after_gap.pk])
+
+    def test_rollups_consumer_recomputes_touched_days(self):
+        services.borrow_book(self.member, self.book.pk)
+        list(events.consume('rollups', now=self.later()))
+        rollup = DailyLoanRollup.objects.get(day=timezone.localdate(), category='fiction')
+        self.assertEqual(rollup.borrowed, 1)
+
+
+class VendorAssetTests(TestCase):
+    """Bootstrap comes from static/vendor/ once vendored, from the pinned CDN copy until then."""
+
+    def test_unvendored_assets_load_from_the_cdn_with_their_integrity_hash(self):
+        from .assets import VENDOR
+        from .templatetags import assets
+
+        assets._vendored.cache_clear()
+        self.addCleanup(assets._vendored.cache_clear)
+        with mock.patch.object(assets.finders, 'find', return_value=None):
+            html = self.client.get(reverse('index')).content.decode()
+        for url, _, integrity in VENDOR.values():
+            self.assertIn(url, html)
+            self.assertIn(f'integrity="{integrity}" crossorigin="anonymous"', html)
+
+
+class SearchTests(TestCase):
+    """search_books matches titles, authors and ISBNs in any form and survives any input."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dune = make_book(1, title='Dune Messiah', author='Frank Herbert', isbn='9780306406157')
+        cls.other = make_book(2, title='Foundation', author='Isaac Asimov')
+
+    def search(self, query):
+        return list(search_books(Book.objects.all(), query).order_by('-search_rank', 'pk'))
+
+    def test_title_and_author_words(self):
+        self.assertEqual(self.search('messiah'), [self.dune])
+        self.assertEqual(self.search('Herbert'), [self.dune])
+        self.assertEqual(self.search('asim'), [self.other])
+
+    def test_isbn_with_or_without_hyphens(self):
+        for query in ('9780306406157', '978-0-306-40615-7', '0-306-40615-2', '0306406152'):
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query), [self.dune])
+
+    def test_punctuation_only_matches_nothing(self):
+        for query in ('"', '-', '!!', '—'):
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query), [])
+                response = self.client.get(reverse('book_list'), {'search': query})
+                self.assertEqual(response.status_code, 200)
+
+
+class ImportBooksTests(TestCase):
+    """import_books normalises ISBNs, upserts without touching copy counts and rejects bad rows."""
+
+    def import_lines(self, *rows, **options):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'books.jsonl')
+        with open(path, 'w') as stream:
+            for row in rows:
+                stream.write((row if isinstance(row, str) else json.dumps(row)) + '\n')
+        rejects = os.path.join(directory.name, 'rejects.jsonl')
+        call_command('import_books', path, rejects=rejects, stdout=io.StringIO(), **options)
+        with open(rejects) as stream:
+            return [json.loads(line) for line in stream]
+
+    def row(self, **fields):
+        return {
+            'title': 'Dune', 'author': 'Frank Herbert', 'isbn': '978-0-306-40615-7',
+            'publication_date': '1965-08-01', 'total_copies': 3, **fields,
+        }
+
+    def test_isbn_10_and_13_are_stored_as_isbn_13(self):
+        self.import_lines(self.row(), self.row(title='Emma', isbn='0-19-852663-6'))
+        self.assertEqual(
+            sorted(Book.objects.values_list('isbn', flat=True)), ['9780198526636', '9780306406157'],
+        )
+
+    def test_upsert_refreshes_the_catalog_but_keeps_copy_counts(self):
+        book = make_book(1, isbn='9780306406157', total_copies=2, available_copies=1)
+        self.import_lines(self.row(title='Dune (revised)', isbn='0306406152', total_copies=9, available_copies=9))
+        book.refresh_from_db()
+        self.assertEqual(book.title, 'Dune (revised)')
+        self.assertEqual((book.total_copies, book.available_copies), (2, 1))
+        self.assertEqual(Book.objects.count(), 1)
+
+    def test_bad_rows_are_rejected_and_the_rest_imported(self):
+        rejects = self.import_lines(
+            self.row(title=123),
+            self.row(author=['Frank', 'Herbert']),
+            self.row(isbn='978-0-306-40615-8'),
+            self.row(available_copies=4),
+            self.row(category='poetry'),
+            '{"title": ',
+            '["not", "an", "object"]',
+            self.row(isbn='0198526636', title='Emma'),
+        )
+        self.assertEqual([reject['line'] for reject in rejects], [1, 2, 3, 4, 5, 6, 7])
+        self.assertIn('title is not text', rejects[0]['error'])
+        self.assertEqual(list(Book.objects.values_list('title', flat=True)), ['Emma'])
+
+
+class CatalogCacheTests(TestCase):
+    """A borrow refreshes only the borrowed book's pages; a catalog edit refreshes the listings too."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = make_book(1, total_copies=3, available_copies=3)
+        cls.other = make_book(2, total_copies=3, available_copies=3)
+        cls.member = make_member('member')
+
+    def setUp(self):
+        cache.clear()
+        self.list_url = reverse('book_list')
+        self.detail_url = reverse('book_detail', args=[self.book.pk])
+        self.other_url = reverse('book_detail', args=[self.other.pk])
+        for url in (self.list_url, self.detail_url, self.other_url):
+            self.client.get(url)
+
+    def test_borrow_refreshes_the_book_and_nothing_else(self):
+        untouched = get_generations([CATALOG, book_scope(self.other.pk)])
+        with self.captureOnCommitCallbacks(execute=True):
+            services.borrow_book(self.member, self.book.pk)
+        self.assertEqual(get_generations([CATALOG, book_scope(self.other.pk)]), untouched)
+        self.assertContains(self.client.get(self.detail_url), 'Available Copies:</strong> 2')
+        # The listing and facets stay cached; only the page's rows are re-read.
+        with self.assertNumQueries(1):
+            response = self.client.get(self.list_url)
+        self.assertContains(response, 'Available (2)')
+        with self.assertNumQueries(0):
+            self.client.get(self.other_url)
+
+    def test_edit_refreshes_the_listings_and_the_book(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = 'Renamed'
+            self.book.save()
+        self.assertContains(self.client.get(self.list_url), 'Renamed')
+        self.assertContains(self.client.get(self.detail_url), 'Renamed')
+        with self.assertNumQueries(0):
+            self.client.get(self.other_url)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Catalog reads go to replicas except inside transactions, after a write
+    and where they decide a write.
+
+    replica1 is a TEST MIRROR of default, as DB_REPLICAS aliases are, so its
+    queries are real and can be told apart; TransactionTestCase commits
+    each write so the second connection sees it.
+    """
+    # Resolved in setUpClass, once replica1 exists.
+    databases = '__all__'
+    # Keep the counter shards the migrations create.
+    serialized_rollback = True
+
+    @classmethod
+    def setUpClass(cls):
+        primary = connections['default'].settings_dict
+        connections.settings['replica1'] = {**primary, 'TEST': {**primary['TEST'], 'MIRROR': 'default'}}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica1'].close()
+        del connections['replica1']
+        del connections.settings['replica1']
+
+    def setUp(self):
+        cache.clear()
+        self.book = make_book(1, total_copies=1, available_copies=1)
+        self.member = make_member('member')
+        self.client.force_login(self.member)
+
+    def replica_queries(self):
+        return CaptureQueriesContext(connections['replica1'])
+
+    def test_reads_of_routed_models_outside_transactions_use_a_replica(self):
+        self.assertEqual(Book.objects.all().db, 'replica1')
+        self.assertEqual(BorrowRecord.objects.all().db, 'replica1')
+        self.assertEqual(User.objects.all().db, 'default')
+        with transaction.atomic():
+            self.assertEqual(Book.objects.all().db, 'default')
+        with routers.use_primary():
+            self.assertEqual(Book.objects.all().db, 'default')
+        with self.replica_queries() as replica:
+            self.assertEqual(Book.objects.count(), 1)
+        self.assertEqual(len(replica), 1)
+
+    def test_a_write_makes_the_client_read_the_primary(self):
+        with self.replica_queries() as replica:
+            self.client.get(reverse('book_list'))
+        self.assertGreater(len(replica), 0)
+
+        response = self.client.post(reverse('borrow_book', args=[self.book.pk]))
+        cookie = response.cookies[routers.STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.DB_REPLICA_STICKY_SECONDS)
+        self.assertTrue(cookie['httponly'])
+
+        with self.replica_queries() as replica:
+            self.client.get(reverse('book_list'))
+            self.client.get(reverse('borrowed_books'))
+        self.assertEqual(len(replica), 0)
+
+    def test_reads_alone_set_no_cookie(self):
+        response = self.client.get(reverse('book_list'))
+        self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
+
+    def test_reads_that_decide_a_write_use_the_primary(self):
+        record = services.borrow_book(self.member, self.book.pk)
+        other = make_member('other')
+        with self.replica_queries() as replica:
+            self.client.post(reverse('return_book', args=[record.pk]))
+            services.borrow_book(other, self.book.pk)
+            self.client.post(reverse('place_hold', args=[self.book.pk]))
+        self.assertEqual(len(replica), 0)
+        record.refresh_from_db(using='default')
+        self.assertEqual(record.status, 'returned')
+        self.assertTrue(Hold.objects.filter(user=self.member, book=self.book).exists())
+
+
+class CachedUserTests(TestCase):
+    """Logged-in requests take the user from the cache, never its password hash, and still notice changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = make_member('member')
+
+    def setUp(self):
+        cache.clear()
+        self.client.login(username='member', password='x')
+
+    def test_password_change_logs_out_other_sessions(self):
+        self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.member.set_password('changed')
+            self.member.save()
+        self.assertRedirects(
+            self.client.get(reverse('dashboard')), reverse('login') + '?next=' + reverse('dashboard'),
+        )
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.member.is_active = False
+            self.member.save()
+        self.assertIsNone(CachedModelBackend().get_user(self.member.pk))
+        self.assertEqual(self.client.get(reverse('dashboard')).status_code, 302)
+
+    def test_cache_entry_holds_no_password_hash(self):
+        user = CachedModelBackend().get_user(self.member.pk)
+        entry = cache.get(_user_key(self.member.pk))
+        self.assertNotIn('password', entry[0].__dict__)
+        self.assertNotIn(self.member.password.encode(), pickle.dumps(entry))
+        # Anything that needs the hash still gets it, from the database.
+        self.assertTrue(user.check_password('x'))
+
+    def test_logged_in_pages_run_no_auth_queries(self):
+        for url in (reverse('dashboard'), reverse('book_list')):
+            self.client.get(url)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertGreater(len(queries), 0)  # the page's own queries are seen
+            tables = ('auth_user', 'library_app_userprofile', 'django_session')
+            self.assertEqual(
+                [query['sql'] for query in queries if any(table in query['sql'] for table in tables)], [],
+            )
+
+
+class FacetTests(TestCase):
+    """Each facet is counted with the other selections applied, by decade for dates."""
+
+    @classmethod
+    def setUpTestData(cls):
+        make_book(1, category='fiction', publication_date=date(1961, 5, 1))
+        make_book(2, category='fiction', publication_date=date(1969, 12, 31), available_copies=0)
+        make_book(3, category='science', publication_date=date(1970, 1, 1))
+        make_book(4, category='science', publication_date=date(2004, 6, 1), available_copies=0)
+
+    def setUp(self):
+        cache.clear()
+
+    def facets(self, **params):
+        rows = async_to_sync(facets.across_search)('')
+        return facets.tally(rows, facets.selected_facets(params))
+
+    def counts(self, options):
+        return {value: count for value, _, count in options}
+
+    def test_counts_with_nothing_selected(self):
+        options = self.facets()
+        self.assertEqual(self.counts(options['category'])['fiction'], 2)
+        self.assertEqual(self.counts(options['category'])['science'], 2)
+        self.assertEqual(self.counts(options['available']), {'1': 2, '0': 2})
+        self.assertEqual(options['decade'], [('2000', '2000s', 1), ('1970', '1970s', 1), ('1960', '1960s', 2)])
+
+    def test_each_facet_counts_under_the_other_selections(self):
+        options = self.facets(category='fiction', available='1')
+        # Categories keep their alternatives, narrowed by availability only.
+        self.assertEqual(self.counts(options['category'])['science'], 1)
+        self.assertEqual(self.counts(options['category'])['fiction'], 1)
+        self.assertEqual(self.counts(options['available']), {'1': 1, '0': 1})
+        self.assertEqual(options['decade'], [('1960', '1960s', 1)])
+
+    def test_decade_selection_and_narrowing(self):
+        self.assertEqual(facets.selected_facets({'decade': '1965'})['decade'], 1960)
+        books = facets.narrow(Book.objects.all(), facets.selected_facets({'decade': '1960'}))
+        self.assertEqual(sorted(books.values_list('publication_date__year', flat=True)), [1961, 1969])
+
+    def test_invalid_values_select_nothing(self):
+        for params in ({'decade': 'abc'}, {'decade': '-10'}, {'decade': '99999'}, {'available': 'yes'},
+                       {'category': 'poetry'}):
+            with self.subTest(params=params):
+                self.assertEqual(
+                    facets.selected_facets(params), {'category': None, 'available': None, 'decade': None},
+                )
+                response = self.client.get(reverse('book_list'), params)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.context['books']), 4)
+
+
+class RecommendationTests(TestCase):
+    """Neighbours are ranked by cosine similarity and incremental runs catch every changed score."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = [make_book(number) for number in range(4)]
+        cls.members = [make_member(f'member{number}') for number in range(3)]
+
+    def borrow(self, member, *books):
+        for book in books:
+            services.borrow_book(self.members[member], self.books[book].pk)
+
+    def stored(self, book):
+        return [
+            (recommendation.recommended_id, recommendation.co_borrows, round(recommendation.score, 3))
+            for recommendation in BookRecommendation.objects.filter(book=self.books[book]).order_by('rank')
+        ]
+
+    def test_top_neighbours_ranks_by_cosine_similarity(self):
+        from scipy import sparse
+
+        # Column 0 shares two readers with 1 and three with 2, but 2 is a bestseller.
+        matrix = sparse.csc_matrix([[1, 1, 1], [1, 1, 1], [1, 0, 1]] + [[0, 0, 1]] * 5, dtype='float32')
+        neighbours = dict(recommendations.top_neighbours(matrix, [0, 1, 2], limit=5))
+        self.assertEqual([(column, shared) for column, shared, _ in neighbours[0]], [(1, 2), (2, 3)])
+        self.assertAlmostEqual(neighbours[0][0][2], 2 / (3 * 2) ** 0.5, places=5)
+        self.assertAlmostEqual(neighbours[0][1][2], 3 / (3 * 8) ** 0.5, places=5)
+        self.assertEqual([column for column, _, _ in neighbours[1]], [0, 2])
+        self.assertEqual(len(dict(recommendations.top_neighbours(matrix, [2], limit=1))[2]), 1)
+
+    def test_incremental_refresh_follows_the_checkpoint(self):
+        self.borrow(0, 0, 1)
+        self.borrow(1, 1, 2)
+        self.assertEqual(recommendations.refresh(), 3)
+        self.assertEqual(self.stored(1), [(self.books[0].pk, 1, 0.707), (self.books[2].pk, 1, 0.707)])
+        self.assertEqual(recommendations.refresh(), 0)
+
+        # Book 2 gains a reader who borrowed nothing else: book 1's score for
+        # it drops even though book 1's own readers did nothing.
+        self.borrow(2, 2)
+        self.assertEqual(recommendations.refresh(), 2)
+        self.assertEqual(self.stored(1), [(self.books[0].pk, 1, 0.707), (self.books[2].pk, 1, 0.5)])
+        self.assertEqual(self.stored(2), [(self.books[1].pk, 1, 0.5)])
+        last_loan = BorrowRecord.objects.order_by('-id').first()
+        self.assertEqual(JobCheckpoint.objects.get(name=recommendations.CHECKPOINT).position, last_loan.pk)
@@ -1,5 +1,8 @@
 
-from django.urls import path
+import re
+
+from django.conf import settings
+from django.urls import path, re_path
 from . import views
 
 urlpatterns = [
@@ -9,10 +12,18 @@ urlpatterns = [
     path('logout/', views.logout_view, name='logout'),
     path('books/', views.book_list, name='book_list'),
     path('book/<int:book_id>/', views.book_detail, name='book_detail'),
+    path('books/availability/', views.book_availability, name='book_availability'),
     path('borrow/<int:book_id>/', views.borrow_book, name='borrow_book'),
     path('return/<int:borrow_id>/', views.return_book, name='return_book'),
+    path('hold/<int:book_id>/', views.place_hold, name='place_hold'),
+    path('hold/<int:hold_id>/cancel/', views.cancel_hold, name='cancel_hold'),
     path('dashboard/', views.dashboard, name='dashboard'),
     path('librarian/', views.librarian_dashboard, name='librarian_dashboard'),
     path('add-book/', views.add_book, name='add_book'),
     path('borrowed-books/', views.borrowed_books, name='borrowed_books'),
+    path('history/', views.loan_history, name='loan_history'),
+    path('export/<slug:dataset>.<slug:fmt>', views.export_data, name='export_data'),
+    path('metrics/', views.metrics, name='metrics'),
+    # runserver serves STATIC_URL itself while DEBUG is on.
+    re_path(r'^%s(?P<path>.+)$' % re.escape(settings.STATIC_URL.lstrip('/')), views.static_asset, name='static_asset'),
 ]
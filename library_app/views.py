@@ -1,24 +1,107 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import aget_object_or_404, render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
+from django.contrib.staticfiles import finders
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.handlers.asgi import ASGIRequest
+from django.template.backends.utils import csrf_input
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse,
+)
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date
+from django.utils.safestring import mark_safe
+from django.views.decorators.http import require_POST
+from django.views.static import was_modified_since
+from django.db import DEFAULT_DB_ALIAS, transaction
 from django.db.models import Q
 from datetime import date
-from .models import Book, BorrowRecord, UserProfile
+import mimetypes
+import os
+import re
+from .models import OPEN_STATUSES, Book, BorrowRecord, Hold, UserProfile
+from . import assets, exports, facets, metrics as request_metrics, recommendations, reports, services, stats
+from .cache import CATALOG, STATS, apage_key, arender_fragments, book_scope, cache_anonymous_page
+from .pagination import KeysetPage, apaginate, get_page_size, paginate
+from .querybudget import query_budget
+from .search import search_books
+
+
+def is_librarian(user):
+    profile = getattr(user, 'userprofile', None)
+    return user.is_staff or (profile is not None and profile.is_librarian)
+
+
+async def aload_user(request):
+    """
+    Resolve request.user, with its profile, before an async view renders.
+
+    Templates read user.userprofile; left lazy, that would be a synchronous
+    query in the middle of rendering, which async code may not run.
+    """
+    user = await request.auser()
+    if user.is_authenticated and not User.userprofile.is_cached(user):
+        user = await User.objects.select_related('userprofile').aget(pk=user.pk)
+    request.user = user
+    return user
+
+
+# Cards are shared between members, so their hold forms are cached with this
+# marker in place of a CSRF token and get the request's own token afterwards.
+CSRF_SLOT = '<!-- csrf_token -->'
+
+
+async def abook_cards(books, request):
+    """Catalog card HTML for each book, cached until the book changes."""
+    authenticated = request.user.is_authenticated
+    cards = await arender_fragments('book_card.html', [
+        ((book.pk, book.updated_at.timestamp(), int(authenticated)),
+         {'book': book, 'authenticated': authenticated, 'csrf_slot': mark_safe(CSRF_SLOT)})
+        for book in books
+    ])
+    if not authenticated:
+        return cards
+    token = csrf_input(request)
+    return [mark_safe(card.replace(CSRF_SLOT, token)) for card in cards]
+
+
+async def acatalog_page(request, books, ordering):
+    """
+    The page of books the request asks for, with current copy counts.
+
+    For anonymous visitors, which books make up the page is cached under the
+    catalog generation, which borrows and returns leave alone; the rows
+    themselves are re-read by primary key every time.
+    """
+    cursor, page_size = request.GET.get('cursor'), get_page_size(request)
+    if request.user.is_authenticated:
+        return await apaginate(books, ordering, cursor, page_size)
+    key = await apage_key(request, 'book_list.ids', [CATALOG])
+    listing = await cache.aget(key)
+    if listing is None:
+        page = await apaginate(books, ordering, cursor, page_size)
+        listing = ([book.pk for book in page], page.next_cursor, page.previous_cursor)
+        await cache.aset(key, listing, settings.LIBRARY_PAGE_CACHE_TIMEOUT)
+        return page
+    ids, next_cursor, previous_cursor = listing
+    books = Book.objects.defer('search_vector', 'description').filter(pk__in=ids)
+    rows = {book.pk: book async for book in books}
+    return KeysetPage([rows[pk] for pk in ids if pk in rows], next_cursor, previous_cursor)
 
 
 # HOME PAGE
-def index(request):
+@query_budget(4)
+@cache_anonymous_page(lambda request: [STATS])
+async def index(request):
     """Homepage"""
-    
-    context = {
-        'total_books': Book.objects.count(),
-        'available_books': Book.objects.filter(available_copies__gt=0).count(),
-        'total_users': User.objects.count(),
-        'total_borrowed': BorrowRecord.objects.filter(status='borrowed').count(),
-    }
-    return render(request, 'index.html', context)
+    await aload_user(request)
+    return render(request, 'index.html', await stats.aget_counts())
 
 
 # REGISTER
@@ -41,7 +124,9 @@ def register(request):
             messages.error(request, 'Username already exists!')
             return redirect('register')
         
-        user = User.objects.create_user(username=username, email=email, password=password)
+        # One transaction with the outbox event the post_save signal writes.
+        with transaction.atomic():
+            User.objects.create_user(username=username, email=email, password=password)
         messages.success(request, 'Account created! Please login.')
         return redirect('login')
     
@@ -78,68 +163,205 @@ def logout_view(request):
 
 
 # BOOK LIST
-def book_list(request):
+@query_budget(5)
+async def book_list(request):
     """Browse books"""
+    await aload_user(request)
     search_query = request.GET.get('search', '')
-    category = request.GET.get('category', '')
+    selected = facets.selected_facets(request.GET)
 
-    books = Book.objects.all()
+    books = Book.objects.defer('search_vector', 'description')
+    ordering = ['-created_at', '-id']
 
     if search_query:
-        books = books.filter(title__icontains=search_query)
-    if category:
-        books = books.filter(category=category)
+        books = search_books(books, search_query)
+        ordering = ['-search_rank'] + ordering
+    books = facets.narrow(books, selected)
+
+    page = await acatalog_page(request, books, ordering)
 
     context = {
-        'books': books,
+        'books': page,
+        'cards': await abook_cards(page, request),
+        'page': page,
         'search_query': search_query,
-        'category': category,
+        'category': selected['category'] or '',
+        'available': request.GET.get('available', '') if selected['available'] is not None else '',
+        'decade': str(selected['decade'] or ''),
+        'facets': facets.tally(await facets.across_search(search_query), selected),
     }
     return render(request, 'book_list.html', context)
 
 
 # BOOK DETAIL
-def book_detail(request, book_id):
+@query_budget(5)
+@cache_anonymous_page(lambda request, book_id: [book_scope(book_id)])
+async def book_detail(request, book_id):
     """Book details"""
-    book = {'id': book_id, 'title': 'Sample Book'}
-    return render(request, 'book_detail.html', {'book': book})
+    await aload_user(request)
+    book = await aget_object_or_404(Book.objects.defer('search_vector'), pk=book_id)
+    return render(request, 'book_detail.html', {
+        'book': book,
+        'recommendations': await recommendations.afor_book(book_id),
+    })
+
+
+# BOOK AVAILABILITY
+@query_budget(1)
+async def book_availability(request):
+    """Live copy counts for ?ids=1,2,3 as JSON"""
+    try:
+        ids = [int(value) for value in request.GET.get('ids', '').split(',') if value.strip()]
+    except ValueError:
+        return JsonResponse({'error': 'ids must be a comma-separated list of integers.'}, status=400)
+    if len(ids) > settings.LIBRARY_MAX_PAGE_SIZE:
+        return JsonResponse(
+            {'error': 'At most %d ids per request.' % settings.LIBRARY_MAX_PAGE_SIZE}, status=400,
+        )
+    books = Book.objects.filter(pk__in=ids).values_list('id', 'available_copies', 'total_copies')
+    return JsonResponse({
+        'books': {
+            str(book_id): {'available_copies': available, 'total_copies': total}
+            async for book_id, available, total in books
+        },
+    })
 
 
 # BORROW BOOK
+@query_budget(9)
+@require_POST
 @login_required(login_url='login')
 def borrow_book(request, book_id):
     """Borrow book"""
+    try:
+        services.borrow_book(request.user, book_id)
+    except services.BookUnavailable:
+        messages.error(request, 'Sorry, no copies of this book are available.')
+        return redirect('book_list')
     messages.success(request, 'Book borrowed!')
     return redirect('book_list')
 
 
 #BORROWED BOOKS
+@query_budget(4)
 @login_required
 def borrowed_books(request):
-    records = BorrowRecord.objects.filter(user=request.user, status='borrowed')
-    return render(request, 'borrowed_books.html', {'records': records})
+    records = (
+        BorrowRecord.objects
+        .filter(user=request.user, status__in=OPEN_STATUSES)
+        .select_related('book')
+        .only('borrow_date', 'due_date', 'status', 'book__title', 'book__author')
+    )
+    page = paginate(records, ['-borrow_date', '-id'], request.GET.get('cursor'), get_page_size(request))
+    return render(request, 'borrowed_books.html', {'records': page, 'page': page})
+
+
+# LOAN HISTORY
+@query_budget(4)
+@login_required(login_url='login')
+def loan_history(request):
+    """Every loan, including archived ones"""
+    page = reports.loan_history(request.user, request.GET.get('cursor'), get_page_size(request))
+    return render(request, 'loan_history.html', {'records': page, 'page': page})
 
 
 # RETURN BOOK
+@query_budget(9)
+@require_POST
 @login_required(login_url='login')
 def return_book(request, borrow_id):
     """Return book"""
+    # From the primary: a loan made moments ago may not have reached a replica.
+    record = get_object_or_404(BorrowRecord.objects.using(DEFAULT_DB_ALIAS), pk=borrow_id, user=request.user)
+    try:
+        services.return_book(record)
+    except services.NotBorrowed:
+        messages.info(request, 'This book has already been returned.')
+        return redirect('index')
     messages.success(request, 'Book returned!')
     return redirect('index')
 
 
+# PLACE HOLD
+@query_budget(8)
+@require_POST
+@login_required(login_url='login')
+def place_hold(request, book_id):
+    """Join the queue for an unavailable book"""
+    try:
+        hold = services.place_hold(request.user, book_id)
+    except Book.DoesNotExist:
+        messages.error(request, 'Book not found.')
+        return redirect('book_list')
+    except services.HoldNotNeeded:
+        messages.info(request, 'A copy is available now - borrow it instead.')
+        return redirect('book_detail', book_id=book_id)
+    except services.AlreadyHeld:
+        messages.info(request, 'You already have a hold on this book.')
+        return redirect('dashboard')
+    messages.success(request, f'Hold placed! You are number {services.queue_position(hold)} in the queue.')
+    return redirect('dashboard')
+
+
+# CANCEL HOLD
+@query_budget(9)
+@require_POST
+@login_required(login_url='login')
+def cancel_hold(request, hold_id):
+    """Withdraw a hold"""
+    hold = get_object_or_404(Hold.objects.only('book_id', 'created_at'), pk=hold_id, user=request.user)
+    services.cancel_hold(hold)
+    messages.success(request, 'Hold cancelled.')
+    return redirect('dashboard')
+
+
 # DASHBOARD
+@query_budget(5)
 @login_required(login_url='login')
 def dashboard(request):
     """User dashboard"""
-    return render(request, 'book_list.html')
+    borrowed, returned = reports.user_loans(request.user)
+    return render(request, 'dashboard.html', {
+        'borrowed_books': borrowed,
+        'returned_books': returned,
+        'holds': reports.user_holds(request.user),
+    })
 
 
 # LIBRARIAN DASHBOARD
+@query_budget(5)
 @login_required(login_url='login')
 def librarian_dashboard(request):
     """Admin dashboard"""
-    return render(request, 'book_list.html')
+    if not is_librarian(request.user):
+        messages.error(request, 'The librarian dashboard is for library staff only.')
+        return redirect('dashboard')
+    context = reports.librarian_stats()
+    context['trend'] = reports.daily_trend()
+    return render(request, 'librarian_dashboard.html', context)
+
+
+# EXPORT
+@login_required(login_url='login')
+def export_data(request, dataset, fmt):
+    """Stream a dataset as CSV or JSON Lines, for librarians"""
+    if not is_librarian(request.user):
+        messages.error(request, 'Exports are for library staff only.')
+        return redirect('dashboard')
+    if dataset not in exports.DATASETS or fmt not in exports.FORMATS:
+        raise Http404('Unknown export')
+    try:
+        filters = exports.loan_filters(
+            request.GET.get('status'), request.GET.get('borrowed_from'), request.GET.get('borrowed_to'),
+        )
+    except ValueError as exc:
+        return HttpResponse(str(exc), status=400, content_type='text/plain')
+    header, rows = exports.rows(dataset, filters, archived=request.GET.get('archived') == '1')
+    # Under ASGI a sync iterator would be read into memory before sending.
+    stream = exports.astream if isinstance(request, ASGIRequest) else exports.stream
+    response = StreamingHttpResponse(stream(fmt, header, rows), content_type=exports.FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{dataset}-{date.today():%Y%m%d}.{fmt}"'
+    return response
 
 
 # ADD BOOK
@@ -147,3 +369,54 @@ def librarian_dashboard(request):
 def add_book(request):
     """Add new book"""
     return render(request, 'book_list.html')
+
+
+# STATIC FILES
+def static_asset(request, path):
+    """Collected static files, precompressed, cached for a year once hashed"""
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404(path)
+    if not os.path.isfile(full_path):
+        # Under DEBUG, files collectstatic has not copied yet come straight
+        # from the app and project static directories.
+        full_path = settings.DEBUG and finders.find(path)
+        if not full_path:
+            raise Http404(path)
+    mtime = os.stat(full_path).st_mtime
+    if not was_modified_since(request.headers.get('If-Modified-Since'), mtime):
+        return HttpResponseNotModified()
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    accepted = request.headers.get('Accept-Encoding', '')
+    encoding = None
+    for suffix, name in assets.ENCODINGS:
+        if re.search(r'\b%s\b' % name, accepted) and os.path.isfile(full_path + suffix):
+            full_path, encoding = full_path + suffix, name
+            break
+    response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Last-Modified'] = http_date(mtime)
+    if assets.HASHED_NAME.search(path):
+        # The name changes whenever the content does.
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'public, max-age=300'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+# METRICS
+def metrics(request):
+    """Prometheus metrics for staff or a scraper holding METRICS_TOKEN"""
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    authorised = (
+        settings.METRICS_TOKEN and constant_time_compare(token, settings.METRICS_TOKEN)
+    ) or request.user.is_staff
+    if not authorised:
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(
+        request_metrics.render_prometheus(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -2,6 +2,8 @@
 ASGI config for library_system project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The read-heavy catalog views are async, so serve it with an ASGI server,
+e.g. ``uvicorn library_system.asgi:application --workers 4``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
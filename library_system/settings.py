@@ -46,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'library_app.middleware.RequestMetricsMiddleware',
+    'library_app.middleware.ReplicaStickinessMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,12 +61,21 @@ ROOT_URLCONF = 'library_system.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates plus render timing for RequestMetricsMiddleware
+        'BACKEND': 'library_app.template_backend.InstrumentedDjangoTemplates',
         'DIRS': [
             os.path.join(BASE_DIR, 'templates')
             ],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Compiled templates are kept for the life of the process; the
+            # development server's autoreloader clears them when a template
+            # changes, so it is safe to use under DEBUG as well.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
@@ -79,19 +90,140 @@ WSGI_APPLICATION = 'library_system.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+#
+# Connections outlive requests: DB_CONN_MAX_AGE is how many seconds one is
+# kept ("None" for no limit, 0 to close after every request) and
+# DB_CONN_HEALTH_CHECKS pings a reused connection before handing it out.
+# On PostgreSQL, DB_POOL=True uses a psycopg connection pool instead
+# (pip install "psycopg[pool]").  Prefer that under ASGI, where the threads
+# holding persistent connections do not outlive a request.  Pool size and
+# wait times are exported on /metrics/.
+#
+# Tests: `python manage.py test` uses these same DB_* variables and creates
+# test_<DB_NAME> on the server, so a local Postgres needs only DB_USER and
+# DB_PASSWORD.  Without one, SQLite stands in:
+#   DB_ENGINE=django.db.backends.sqlite3 python manage.py test
+DB_ENGINE = os.getenv('DB_ENGINE', 'django.db.backends.postgresql')
+DB_POOL = DB_ENGINE == 'django.db.backends.postgresql' and os.getenv('DB_POOL', 'False') == 'True'
+DB_CONN_MAX_AGE = os.getenv('DB_CONN_MAX_AGE', '60')
 
-# Database
 DATABASES = {
     'default': {
-        'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.postgresql'),
-        'NAME': os.getenv('DB_NAME', 'library_system'),
+        'ENGINE': DB_ENGINE,
+        'NAME': os.getenv(
+            'DB_NAME',
+            BASE_DIR / 'db.sqlite3' if DB_ENGINE == 'django.db.backends.sqlite3' else 'library_system',
+        ),
         'USER': os.getenv('DB_USER', 'postgres'),
         'PASSWORD': os.getenv('DB_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', 'localhost'),
         'PORT': os.getenv('DB_PORT', '5432'),
+        # A pool replaces persistent connections; Django refuses both at once.
+        'CONN_MAX_AGE': 0 if DB_POOL else (None if DB_CONN_MAX_AGE == 'None' else int(DB_CONN_MAX_AGE)),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+                'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+                # Seconds a request waits for a free connection before failing
+                'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+            },
+        } if DB_POOL else {},
     }
 }
 
+# Read replicas: DB_REPLICAS lists their hosts (PostgreSQL) or database files
+# (SQLite), comma-separated; they become aliases replica1, replica2, ... with
+# default's other settings.  library_app/routers.py sends catalog and loan
+# reads to them, and a client that writes reads from the primary for
+# DB_REPLICA_STICKY_SECONDS afterwards.  Tests read them through default.
+# To try it locally on SQLite, migrate and seed db.sqlite3, copy it to
+# replica.sqlite3 and set DB_REPLICAS=replica.sqlite3.
+DB_REPLICAS = [location.strip() for location in os.getenv('DB_REPLICAS', '').split(',') if location.strip()]
+DATABASE_REPLICAS = []
+for number, location in enumerate(DB_REPLICAS, 1):
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME' if DB_ENGINE == 'django.db.backends.sqlite3' else 'HOST': location,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['library_app.routers.ReplicaRouter']
+DB_REPLICA_STICKY_SECONDS = int(os.getenv('DB_REPLICA_STICKY_SECONDS', '10'))
+
+# Cache
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION at a shared
+# backend (e.g. django.core.cache.backends.redis.RedisCache) in production.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'library-system'),
+    }
+}
+if CACHES['default']['BACKEND'].endswith(('LocMemCache', 'FileBasedCache')):
+    # The default of 300 entries would evict book cards before a page of
+    # them is even rendered twice.
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '20000'))}
+
+# Seconds an anonymous catalog page stays cached (see library_app/cache.py)
+LIBRARY_PAGE_CACHE_TIMEOUT = int(os.getenv('LIBRARY_PAGE_CACHE_TIMEOUT', '300'))
+
+# Seconds a rendered book card stays cached; cards are keyed on the book's
+# updated_at, so edits and borrows show at once regardless
+LIBRARY_FRAGMENT_CACHE_TIMEOUT = int(os.getenv('LIBRARY_FRAGMENT_CACHE_TIMEOUT', '86400'))
+
+# Sessions are read from the cache and written through to the database, so
+# they survive a cache flush; set SESSION_ENGINE to
+# django.contrib.sessions.backends.signed_cookies to keep them client-side.
+SESSION_ENGINE = os.getenv('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+
+# Logged-in users and their profiles are cached between requests for this
+# many seconds; saving either drops the entry (see library_app/backends.py).
+AUTHENTICATION_BACKENDS = ['library_app.backends.CachedModelBackend']
+LIBRARY_USER_CACHE_TIMEOUT = int(os.getenv('LIBRARY_USER_CACHE_TIMEOUT', '300'))
+
+# "Readers also borrowed" books shown per book (manage.py compute_recommendations)
+LIBRARY_RECOMMENDATIONS = int(os.getenv('LIBRARY_RECOMMENDATIONS', '6'))
+
+# Days before a loan is due that its member is emailed a reminder
+# (manage.py send_reminders)
+LIBRARY_REMINDER_DAYS = int(os.getenv('LIBRARY_REMINDER_DAYS', '2'))
+
+# Seconds consume_events waits before skipping a gap in the event ids, which
+# may be a transaction still in flight (see library_app/events.py)
+LIBRARY_EVENT_SETTLE_SECONDS = int(os.getenv('LIBRARY_EVENT_SETTLE_SECONDS', '5'))
+
+# Returned loans older than this many days move to the archive table
+# (manage.py archive_loans)
+LIBRARY_ARCHIVE_AFTER_DAYS = int(os.getenv('LIBRARY_ARCHIVE_AFTER_DAYS', '365'))
+
+# Raise instead of logging when a view exceeds its @query_budget
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', str(DEBUG)) == 'True'
+
+# Requests slower than this are logged with their SQL to library_app.slow
+LIBRARY_SLOW_REQUEST_MS = int(os.getenv('LIBRARY_SLOW_REQUEST_MS', '500'))
+
+# Lets a Prometheus scraper read /metrics/ with "Authorization: Bearer <token>";
+# staff users can always read it.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'library_app': {
+            'handlers': ['console'],
+            'level': os.getenv('LIBRARY_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -126,8 +258,20 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
+#
+# `manage.py collectstatic` minifies CSS, writes content-hashed copies and
+# gzip/brotli siblings to STATIC_ROOT, and the app serves them from there
+# with far-future cache headers (library_app/assets.py).  Without DEBUG,
+# run collectstatic before serving: only STATIC_ROOT is served then.
+# Bootstrap is loaded from its CDN until `manage.py vendor_assets` has
+# fetched it.
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
+STATIC_ROOT = os.getenv('STATIC_ROOT', os.path.join(BASE_DIR, 'staticfiles'))
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'library_app.assets.CompressedManifestStaticFilesStorage'},
+}
 
 
 # Default primary key field type
@@ -135,6 +279,22 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Catalog and borrow-history page sizes (keyset paginated, see library_app/pagination.py)
+LIBRARY_PAGE_SIZE = int(os.getenv('LIBRARY_PAGE_SIZE', '24'))
+LIBRARY_MAX_PAGE_SIZE = int(os.getenv('LIBRARY_MAX_PAGE_SIZE', '100'))
+
+# Email
+# SMTP by default; EMAIL_BACKEND=django.core.mail.backends.console.EmailBackend
+# prints messages instead, and a local stand-in such as
+# `python -m aiosmtpd -n -l localhost:1025` works with EMAIL_PORT=1025.
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'False') == 'True'
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'library@localhost')
+
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'